@@ -0,0 +1,209 @@
+"""Wall time and peak memory of the main pipeline steps at several scales.
+
+Run from the repository root, e.g.
+
+    python benchmarks/run_benchmarks.py --users 1000 10000 --days 100 --backends python numpy
+
+Every step runs in a fresh process, and steps pass their output on through files: the
+simulation and save_to_csv share one process, since the log is written from memory, and every
+later step reads the log (or the per-user table for normalise) back before it is measured. The
+peak memory of a step is the peak resident size of its process, next to the resident size once
+its input was loaded (baseline_rss_mb), so a regression in any step shows in its own row. With
+--tracemalloc, the peak of the memory allocated during each step is traced as well, at the cost
+of slower steps. Results are appended to benchmarks/results.csv with the commit they were
+measured on, to compare runs across changes.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import datetime
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from count_edges_nodes import build_interaction_graph, GRAPH_COLUMNS  # noqa: E402
+from instances_rdf import export_instances  # noqa: E402
+from loader import read_simulation_log, METRICS_COLUMNS  # noqa: E402
+from main import Simulation  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+ROOMS_AND_OBJECTS = {
+    "Classroom": ["Desk", "Book", "Computer"],
+    "Auditorium": ["Chair1", "Screen", "Hand"],
+    "Café": ["Chair2", "Student", "Table"],
+}
+
+STEPS = ("simulation", "save_to_csv", "calculate_per_user", "normalise", "rdf_export", "graph")
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results.csv")
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def measure(step: str, function, trace: bool = False) -> dict:
+    baseline = peak_rss_mb()
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    traced_peak = None
+    if trace:
+        traced_peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+        tracemalloc.stop()
+    return {"step": step,
+            "seconds": seconds,
+            "baseline_rss_mb": baseline,
+            "peak_rss_mb": peak_rss_mb(),
+            "traced_peak_mb": traced_peak}
+
+
+def run_simulation_steps(num_users: int,
+                         days: int,
+                         backend: str,
+                         workers: int,
+                         tmp: str,
+                         trace: bool = False) -> list[dict]:
+    # save_to_csv writes the log the simulation holds in memory, so both run in this process
+    state = {}
+
+    def simulate():
+        sim = Simulation(num_users=num_users,
+                         rooms_and_objects=ROOMS_AND_OBJECTS,
+                         duration=days,
+                         backend=backend,
+                         workers=workers)
+        sim.run_simulation()
+        state["sim"] = sim
+
+    rows = [measure("simulation", simulate, trace)]
+    state["sim"].df_path = os.path.join(tmp, "simulation_data.csv")
+    rows.append(measure("save_to_csv", state["sim"].save_to_csv, trace))
+    return rows
+
+
+def run_step(step: str, tmp: str, trace: bool = False) -> dict:
+    # a step after save_to_csv, in a process of its own; loading its input is not measured
+    csv_path = os.path.join(tmp, "simulation_data.csv")
+    per_user_path = os.path.join(tmp, "per_user.pickle")
+    state = {}
+    if step in ("calculate_per_user", "normalise"):
+        state["metrics"] = Metrics(read_simulation_log(csv_path, columns=METRICS_COLUMNS),
+                                   total_objects=sum(ROOMS_AND_OBJECTS.values(), []))
+
+    if step == "calculate_per_user":
+        def function():
+            state["per_user"] = state["metrics"].calculate_per_user()
+    elif step == "normalise":
+        per_user = pd.read_pickle(per_user_path)
+
+        def function():
+            state["metrics"].normalise(per_user)
+    elif step == "rdf_export":
+        def function():
+            export_instances(csv_path,
+                             os.path.join(tmp, "instances.nt"),
+                             ontology_path=os.path.join(ROOT, "ontology", "ontologia_avia.ttl"),
+                             rdf_format="nt")
+    elif step == "graph":
+        df = read_simulation_log(csv_path, columns=GRAPH_COLUMNS)
+
+        def function():
+            build_interaction_graph(df)
+
+    row = measure(step, function, trace)
+    if step == "calculate_per_user":
+        # the input of normalise
+        state["per_user"].to_pickle(per_user_path)
+    return row
+
+
+def run_case(num_users: int,
+             days: int,
+             backend: str,
+             workers: int,
+             steps: list[str],
+             trace: bool = False) -> list[dict]:
+    context = multiprocessing.get_context("spawn")
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for step in steps:
+            if step == "save_to_csv":
+                continue
+            # not a multiprocessing.Pool, whose daemonic workers could not start the
+            # simulation's own worker processes
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                if step == "simulation":
+                    rows.extend(executor.submit(run_simulation_steps, num_users, days, backend,
+                                                workers, tmp, trace).result())
+                else:
+                    rows.append(executor.submit(run_step, step, tmp, trace).result())
+    return [dict(row, num_users=num_users, days=days, backend=backend, workers=workers)
+            for row in rows]
+
+
+def steps_for(requested: list[str]) -> list[str]:
+    # every step needs the log written by save_to_csv, which needs the simulation
+    needed = set(requested) | {"simulation", "save_to_csv"}
+    if "normalise" in needed:
+        needed.add("calculate_per_user")
+    return [step for step in STEPS if step in needed]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--days", type=int, nargs="+", default=[100, 365])
+    parser.add_argument("--backends", nargs="+", default=["python", "numpy"])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--steps", nargs="+", choices=STEPS, default=list(STEPS))
+    parser.add_argument("--tracemalloc", action="store_true")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    steps = steps_for(args.steps)
+    commit = git_commit()
+    measured_at = datetime.datetime.now().isoformat(timespec="seconds")
+    rows = []
+    for num_users in args.users:
+        for days in args.days:
+            for backend in args.backends:
+                print(f"{num_users} students, {days} days, {backend} backend")
+                rows.extend(run_case(num_users, days, backend, args.workers, steps,
+                                     args.tracemalloc))
+
+    results = pd.DataFrame(rows).assign(commit=commit, measured_at=measured_at)
+    results = results[["measured_at", "commit", "num_users", "days", "backend", "workers", "step",
+                       "seconds", "baseline_rss_mb", "peak_rss_mb", "traced_peak_mb"]]
+    history = [pd.read_csv(args.output)] if os.path.exists(args.output) else []
+    # rows of earlier runs may miss the newer columns
+    pd.concat(history + [results], ignore_index=True).to_csv(args.output, index=False)
+    values = (["seconds", "baseline_rss_mb", "peak_rss_mb"] +
+              (["traced_peak_mb"] if args.tracemalloc else []))
+    print(results.pivot_table(index=["num_users", "days", "step"], columns="backend",
+                              values=values, sort=False).round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -4,37 +4,46 @@ from sklearn.metrics import confusion_matrix, accuracy_score, precision_score, r
 
 metrics_path = 'data/metrics_simulation_data_100u_200d.csv'
 
-df = pd.read_csv(metrics_path)
+LEVELS = [1, 2, 3]
 
-def categorize(value):
-    if 0 <= value < 0.2:
-        return 1
-    elif 0.2 <= value < 0.4:
-        return 2
-    elif 0.4 <= value <= 1:
-        return 3
-    else:
-        return None
 
-# Apply the function to the 'a' column to create a new categorical column
-df['Results'] = df['Engagement Score'].apply(categorize)
+def categorize_scores(scores: pd.Series) -> pd.Series:
+    # engagement level of each score: 1 below 0.2, 2 below 0.4, 3 up to 1, missing outside [0, 1]
+    values = scores.to_numpy()
+    return pd.Series(np.select([(0 <= values) & (values < 0.2),
+                                (0.2 <= values) & (values < 0.4),
+                                (0.4 <= values) & (values <= 1)],
+                               [1, 2, 3], default=np.nan),
+                     index=scores.index).astype("Int64")
 
-# Save the updated DataFrame back to a CSV file
-df.to_csv('data/metrics_simulation_data_100u_200d_r.csv', index=False)
 
-df = pd.read_csv('data/metrics_simulation_data_100u_200d_r.csv')
+def evaluate(df: pd.DataFrame) -> dict:
+    # how well the categorized engagement score recovers the simulated engagement level
+    y_true = df['Engagement Level']
+    y_pred = categorize_scores(df['Engagement Score'])
+    return {
+        'conf_matrix': confusion_matrix(y_true, y_pred, labels=LEVELS),
+        'accuracy': accuracy_score(y_true, y_pred),
+        'precision': precision_score(y_true, y_pred, labels=LEVELS, average=None, zero_division=0),
+        'recall': recall_score(y_true, y_pred, labels=LEVELS, average=None, zero_division=0),
+        'f1': f1_score(y_true, y_pred, labels=LEVELS, average=None, zero_division=0),
+    }
 
-y_true = df['Engagement Level']
-y_pred = df['Results']
 
-conf_matrix = confusion_matrix(y_true, y_pred)
+if __name__ == "__main__":
+    df = pd.read_csv(metrics_path)
 
-accuracy = accuracy_score(y_true, y_pred)
+    # Apply the function to the 'a' column to create a new categorical column
+    df['Results'] = categorize_scores(df['Engagement Score'])
 
-precision = precision_score(y_true, y_pred, average=None)
+    # Save the updated DataFrame back to a CSV file
+    df.to_csv('data/metrics_simulation_data_100u_200d_r.csv', index=False)
 
-recall = recall_score(y_true, y_pred, average=None)
+    results = evaluate(df)
+    conf_matrix = results['conf_matrix']
+    accuracy = results['accuracy']
+    precision = results['precision']
+    recall = results['recall']
+    f1 = results['f1']
 
-f1 = f1_score(y_true, y_pred, average=None)
-
-print(f'{conf_matrix=}, {accuracy=}, {precision=}, {recall=}, {f1=}')
+    print(f'{conf_matrix=}, {accuracy=}, {precision=}, {recall=}, {f1=}')
@@ -1,11 +1,15 @@
 import datetime
 import os
+import time
+import numpy as np
 import pandas as pd
 import streamlit as st
 
 from correlation import Analysis
-from main import Simulation
-from metrics import run_metrics
+from jobs import Job, JobRunner
+from main import Simulation, random_seed
+from metrics import calculate_metrics
+from sinks import EventSink
 
 rooms_and_objects = {
     "Classroom": ["Desk", "Book", "Computer"],
@@ -13,11 +17,190 @@ rooms_and_objects = {
     "Café": ["Chair2", "Student", "Table"],
 }
 
+PAGE_SIZES = (50, 100, 500, 1000)
+
 directory_path = "../data"
 if not os.path.exists(directory_path):
     os.makedirs(directory_path)
 
 
+def run_pipeline(job: Job,
+                 num_users: int,
+                 duration: int,
+                 start_date: datetime.date,
+                 seed: int,
+                 rooms: dict[str, list[str]]) -> dict:
+    # simulation, metrics and ANOVA, run on a JobRunner thread; results are passed in memory
+    sim = Simulation(num_users=num_users,
+                     rooms_and_objects=rooms,
+                     duration=duration,
+                     start_date=start_date.strftime("%Y-%m-%d"),
+                     seed=seed)
+    sim.run_simulation(progress=lambda done, total: job.report(done, total, "Simulating"))
+    df = sim.events.to_frame(details=True)
+
+    job.report(job.done, job.total, "Calculating metrics")
+    metrics_df = calculate_metrics(df, rooms_and_objects=rooms, weights=None)
+
+    job.report(job.done, job.total, "Running the correlation analysis")
+    return {"df": df, "metrics": metrics_df, "anova": Analysis(df=metrics_df).anova()}
+
+
+# One runner for the whole server: jobs keep running while the script reruns, and a finished
+# job is the cached result of its parameters, so shown again instantly. Cached frames are
+# shared between sessions and must not be modified in place.
+@st.cache_resource
+def job_runner() -> JobRunner:
+    return JobRunner(max_workers=2)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def kde_figure(key: tuple, _metrics_df: pd.DataFrame):
+    return Analysis(df=_metrics_df).plot_kde(st=True)
+
+
+def job_key(num_users, duration, start_date, seed, rooms) -> tuple:
+    # hashable version of the parameters, the rooms as a tuple of (room, objects) pairs
+    return (num_users, duration, start_date, seed,
+            tuple((room, tuple(objects)) for room, objects in rooms.items()))
+
+
+def job_label(num_users, duration, start_date, seed, rooms) -> str:
+    return f"{num_users} students, {duration} days from {start_date}, seed {seed}"
+
+
+def show_jobs(runner: JobRunner):
+    # the jobs this session submitted, with a progress bar and a cancel button while running
+    for key in st.session_state.setdefault("jobs", []):
+        job = runner.get(key)
+        if job is None:
+            continue
+        col1, col2 = st.columns([4, 1])
+        status = job.status
+        if status in ("queued", "running"):
+            col1.progress(job.fraction, text=f"{job.label}: {job.stage}")
+            if col2.button("Cancel", key=f"cancel {job.label}"):
+                job.cancel()
+        else:
+            col1.write(f"{job.label}: {status}")
+            if status == "done" and col2.button("Show", key=f"show {job.label}"):
+                st.session_state["shown_job"] = key
+            elif status == "failed":
+                col1.error(job.error())
+
+
+def matching_names(names: pd.Index, search: str) -> np.ndarray:
+    # codes of the names that contain any of the comma separated terms, ignoring case
+    terms = [term.strip() for term in search.split(",") if term.strip()]
+    matches = np.zeros(len(names), dtype=bool)
+    for term in terms:
+        matches |= names.str.contains(term, case=False, regex=False)
+    return np.flatnonzero(matches)
+
+
+def filter_log(df: pd.DataFrame,
+               user_search: str,
+               rooms: list[str],
+               activity_types: list[str],
+               dates: tuple[datetime.date, datetime.date]) -> np.ndarray:
+    # positions of the rows that pass every filter, an empty selection does not filter
+    mask = np.ones(len(df), dtype=bool)
+    if user_search.strip():
+        usernames = df["username"]
+        mask &= np.isin(usernames.cat.codes.to_numpy(),
+                        matching_names(usernames.cat.categories, user_search))
+    for column, values in (("room", rooms), ("activity_type", activity_types)):
+        if values:
+            mask &= df[column].isin(values).to_numpy()
+    if len(dates) == 2:
+        timestamps = df["timestamp"].to_numpy()
+        mask &= timestamps >= np.datetime64(dates[0])
+        mask &= timestamps < np.datetime64(dates[1] + datetime.timedelta(days=1))
+    return np.flatnonzero(mask)
+
+
+def show_page(df: pd.DataFrame, key: str, positions: np.ndarray = None):
+    # only the rows of the current page are sent to the browser
+    if positions is None:
+        positions = np.arange(len(df))
+    col1, col2 = st.columns([1, 3])
+    page_size = col1.selectbox("Rows per page", PAGE_SIZES, key=f"{key} page size")
+    num_pages = max(-(-len(positions) // page_size), 1)
+    page = col2.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, value=1,
+                             key=f"{key} page")
+    start = (page - 1) * page_size
+    st.dataframe(df.iloc[positions[start:start + page_size]])
+    st.caption(f"Rows {min(start + 1, len(positions))} to "
+               f"{min(start + page_size, len(positions))} of {len(positions)}")
+
+
+def show_log(df: pd.DataFrame, key: str):
+    first_day = df["timestamp"].min().date()
+    last_day = df["timestamp"].max().date()
+    col1, col2 = st.columns(2)
+    # names are searched here rather than listed in the browser, there can be 100k of them
+    user_search = col1.text_input("Students", placeholder="Name contains, e.g. Ana, Souza",
+                                  key=f"{key} users")
+    rooms = col2.multiselect("Rooms", df["room"].cat.categories, key=f"{key} rooms")
+    activity_types = col1.multiselect("Activity types", df["activity_type"].cat.categories,
+                                      key=f"{key} activity types")
+    dates = col2.date_input("Dates", (first_day, last_day), min_value=first_day,
+                            max_value=last_day, key=f"{key} dates")
+    positions = filter_log(df, user_search, rooms, activity_types, dates)
+
+    # aggregates over all the filtered rows, not only the visible page
+    filtered = df.iloc[positions]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Events", f"{len(filtered):,}")
+    col2.metric("Students", f"{filtered['username'].nunique():,}")
+    col3.metric("Total duration (hours)", f"{filtered['duration'].sum().total_seconds() / 3600:,.1f}")
+    st.dataframe(filtered.groupby("activity_type", observed=True).agg(
+        events=("duration", "size"),
+        mean_duration=("duration", "mean"),
+    ))
+    show_page(df, f"{key} log", positions)
+
+
+def show_results(key: tuple, results: dict):
+    st.header("#")
+    st.header("Simulation Results")
+    # widget keys are per job, the filters of every job keep their own state
+    show_log(results["df"], str(key))
+    st.success("Simulation completed!", icon="✅")
+
+    if st.button("Save CSV files to ../data"):
+        with st.spinner('Saving CSV files...'):
+            num_users, duration = key[:2]
+            df_name = f"simulation_data_{num_users}u_{duration}d"
+            with EventSink(f"{directory_path}/{df_name}.csv") as sink:
+                sink.write(results["df"])
+            results["metrics"].to_csv(f"{directory_path}/metrics_{df_name}.csv", index=False)
+        st.success(f"CSV files saved to {directory_path}!", icon="✅")
+
+    st.header("#")
+    st.header("Calculated Metrics")
+    show_page(results["metrics"], f"{key} metrics")
+    st.success("Metrics calculated!", icon="✅")
+
+    st.header("#")
+    st.header("Correlation Analysis")
+    analysis_dict = results["anova"]
+    col1, col2 = st.columns(2)
+    col1.metric("F-Value",
+                analysis_dict['F-value'],
+                help="The bigger the F-Value, the more significant the correlation.")
+    col2.metric("P-Value",
+                analysis_dict['P-value'],
+                help="The smaller the P-Value, the more significant the correlation.")
+    st.success("Correlation analysis completed!", icon="✅")
+
+    st.header("#")
+    st.header("Engagement Scores by Engagement Levels")
+    fig = kde_figure(key, results["metrics"])
+    st.pyplot(fig)
+    st.success("Plot generated!", icon="✅")
+
+
 def main():
     st.set_page_config(page_title="IVLE-Sim",
                        page_icon=":material/robot_2:",
@@ -49,6 +232,11 @@ def main():
 
     start_date = st.sidebar.date_input("Start Date", datetime.date(2024, 1, 1))
 
+    seed = st.sidebar.number_input(label="Random Seed",
+                                   min_value=0,
+                                   value=random_seed,
+                                   step=1)
+
     """This is a simulation of student interactions in a virtual environment.
     The simulation generates a CSV file with the interactions of each student. 
     You can then calculate metrics based on this data and display charts based on the metrics."""
@@ -59,52 +247,29 @@ def main():
     st.info("Change the parameters on the sidebar and click the following button to run the "
             "script.")
 
-    df_name = f"simulation_data_{num_users}u_{duration}d"
-    df_path = f"{directory_path}/{df_name}.csv"
-    df_path_metrics = f"../data/metrics_{df_name}.csv"
+    params = (num_users, duration, start_date, seed, rooms_and_objects)
+    runner = job_runner()
 
+    # runs are queued on the runner and the page polls them; several parameter sets can be
+    # queued, the results shown are those of the last submitted or selected one
     if st.button(":arrow_forward: Run Simulation, Metrics and Analysis", type="primary"):
-        with st.spinner('Running Simulation and Results...'):
-            st.header("#")
-            st.header("Simulation Results")
-            sim = Simulation(num_users=num_users,
-                             rooms_and_objects=rooms_and_objects,
-                             duration=duration,
-                             start_date=start_date.strftime("%Y-%m-%d"),
-                             generate_csv_file=True,
-                             df_path=df_path)
-            sim.run_simulation()
-            df = pd.read_csv(df_path)
-            st.dataframe(df)
-            st.success("Simulation completed and CSV file generated!", icon="✅")
-
-            st.header("#")
-            st.header("Calculated Metrics")
-            metrics = run_metrics(simulation_df_name=df_name,
-                                  rooms_and_objects=rooms_and_objects,
-                                  weights=None)
-
-            st.dataframe(metrics)
-            st.success("Metrics calculated and CSV file generated!!", icon="✅")
-
-            st.header("#")
-            st.header("Correlation Analysis")
-            analysis = Analysis(df_path_metrics)
-            analysis_dict = analysis.anova()
-            col1, col2 = st.columns(2)
-            col1.metric("F-Value",
-                        analysis_dict['F-value'],
-                        help="The bigger the F-Value, the more significant the correlation.")
-            col2.metric("P-Value",
-                        analysis_dict['P-value'],
-                        help="The smaller the P-Value, the more significant the correlation.")
-            st.success("Correlation analysis completed!", icon="✅")
-
-            st.header("#")
-            st.header("Engagement Scores by Engagement Levels")
-            fig = analysis.plot_kde(st=True)
-            st.pyplot(fig)
-            st.success("Plot generated!", icon="✅")
+        key = job_key(*params)
+        runner.submit(key, run_pipeline, *params, label=job_label(*params))
+        if key not in st.session_state.setdefault("jobs", []):
+            st.session_state["jobs"].append(key)
+        st.session_state["shown_job"] = key
+
+    show_jobs(runner)
+
+    job = runner.get(st.session_state.get("shown_job"))
+    if job is not None and job.status == "done":
+        show_results(job.key, job.result())
+
+    # poll while any job of this session is queued or running
+    jobs = [runner.get(key) for key in st.session_state.get("jobs", [])]
+    if any(job is not None and job.status in ("queued", "running") for job in jobs):
+        time.sleep(0.5)
+        st.rerun()
 
     st.sidebar.write("---")
     st.sidebar.text("Created by Carolina Dias, 2024")
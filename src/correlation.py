@@ -3,18 +3,35 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from scipy.stats import f_oneway
 
+from instrumentation import Instrumentation
+
 
 class Analysis:
-    def __init__(self, df_path: str):
+    def __init__(self,
+                 df_path: str = None,
+                 df: pd.DataFrame = None,
+                 instrumentation: Instrumentation = None):
+        # either the path of a metrics CSV or the metrics themselves
+        if (df_path is None) == (df is None):
+            raise ValueError("Pass either df_path or df")
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
         self.df_path = df_path
-        self.df = pd.read_csv(df_path)
+        if df is None:
+            with self.instrumentation.phase("read_metrics"):
+                df = pd.read_csv(df_path)
+        self.df = df
 
     def anova(self):
-        groups = self.df.groupby('Engagement Level')['Engagement Score'].apply(list)
-        f_val, p_val = f_oneway(*groups)
+        with self.instrumentation.phase("anova", events=len(self.df)):
+            groups = self.df.groupby('Engagement Level')['Engagement Score'].apply(list)
+            f_val, p_val = f_oneway(*groups)
         return {'F-value': round(f_val, 2), 'P-value': round(p_val, 2)}
 
     def plot_kde(self, st: bool = False):
+        with self.instrumentation.phase("plot_kde", events=len(self.df)):
+            return self.draw_kde(st)
+
+    def draw_kde(self, st: bool = False):
         plt.figure(figsize=(10, 6))
         categories = sorted(self.df['Engagement Level'].unique())
         colors = sns.color_palette("colorblind")
@@ -1,42 +1,84 @@
 import pandas as pd
 import networkx as nx
 
-# Sample data
-df = pd.read_csv("../data/simulation_data_200u_200d.csv")
-
-# Create a directed graph
-G = nx.DiGraph()
-
-# Process each row in the DataFrame
-for index, row in df.iterrows():
-    student = row['username']
-    room = row['room']
-    object_ = row['object']
-
-    # Add student and room to nodes
-    G.add_node(student, type='Student')
-    if room:
-        G.add_node(room, type='Room')
-
-    # Add object to nodes if it's an interaction
-    if row['activity_type'] == 'interaction' and object_:
-        G.add_node(object_, type='Object')
-        G.add_edge(student, object_, type='interaction', timestamp=row['timestamp'])
-
-    # Add movement edges
-    if row['activity_type'] == 'movement':
-        if "Moved from" in row['details']:
-            from_room = row['details'].split("Moved from ")[1].split(" to ")[0]
-            to_room = row['details'].split("Moved from ")[1].split(" to ")[1]
-            G.add_node(from_room, type='room')
-            G.add_node(to_room, type='room')
-            G.add_edge(from_room, to_room, type='movement', timestamp=row['timestamp'])
-        else:
-            to_room = row['room']
-            G.add_edge(student, to_room, type='movement', timestamp=row['timestamp'])
-
-# Calculate the number of nodes and edges
-num_nodes = G.number_of_nodes()
-num_edges = G.number_of_edges()
-
-print(f'{num_nodes=} and {num_edges=}')
+from loader import read_simulation_log
+
+GRAPH_COLUMNS = ["username", "student_id", "timestamp", "activity_type", "room", "object",
+                 "details"]
+
+
+def previous_rooms(df: pd.DataFrame) -> pd.Series:
+    # the room a student moved from is the room of their previous event. Older logs have no
+    # student_id and two students can share a name, so there it is read from the details
+    if 'student_id' not in df and 'details' in df:
+        return df['details'].str.extract(r'^Moved from (.+?) to ', expand=False)
+    ordered = df.sort_values('timestamp', kind='stable')
+    key = 'student_id' if 'student_id' in df else 'username'
+    return ordered.groupby(key, sort=False, observed=True)['room'].shift().reindex(df.index)
+
+
+def interaction_edges(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values('timestamp', kind='stable')
+    previous_room = previous_rooms(df)
+    is_movement = df['activity_type'] == 'movement'
+    is_interaction = (df['activity_type'] == 'interaction') & df['object'].notna()
+    from_room = is_movement & previous_room.notna()
+    first_move = is_movement & previous_room.isna()
+
+    def edges(mask, source, target, edge_type):
+        return pd.DataFrame({
+            'source': source[mask].astype(object).to_numpy(),
+            'target': target[mask].astype(object).to_numpy(),
+            'type': edge_type,
+            'timestamp': df['timestamp'][mask].to_numpy(),
+        })
+
+    return pd.concat([
+        edges(is_interaction, df['username'], df['object'], 'interaction'),
+        edges(from_room, previous_room, df['room'], 'movement'),
+        edges(first_move, df['username'], df['room'], 'movement'),
+    ], ignore_index=True)
+
+
+def interaction_nodes(df: pd.DataFrame) -> pd.DataFrame:
+    objects = df['object'][(df['activity_type'] == 'interaction') & df['object'].notna()]
+    return pd.concat([
+        pd.DataFrame({'node': df['username'].astype(object).unique(), 'type': 'Student'}),
+        pd.DataFrame({'node': df['room'].astype(object).unique(), 'type': 'Room'}),
+        pd.DataFrame({'node': objects.astype(object).unique(), 'type': 'Object'}),
+    ], ignore_index=True)
+
+
+def build_interaction_graph(df: pd.DataFrame) -> nx.DiGraph:
+    """Directed graph of students, rooms and objects.
+
+    Students point to the objects they interacted with and to the first room they entered,
+    rooms point to the rooms students moved to. Edges keep the type and the timestamp of the
+    last event between their two nodes.
+    """
+    G = nx.DiGraph()
+    nodes = interaction_nodes(df)
+    G.add_nodes_from(zip(nodes['node'], ({'type': node_type} for node_type in nodes['type'])))
+
+    edges = interaction_edges(df).drop_duplicates(['source', 'target'], keep='last')
+    G.add_edges_from(zip(edges['source'],
+                         edges['target'],
+                         ({'type': edge_type, 'timestamp': timestamp}
+                          for edge_type, timestamp in zip(edges['type'], edges['timestamp']))))
+    return G
+
+
+def interaction_graph_counts(df: pd.DataFrame) -> tuple[int, int]:
+    # number of nodes and edges of build_interaction_graph(df), without building it
+    nodes = interaction_nodes(df)['node']
+    edges = interaction_edges(df)
+    return nodes.nunique(), len(edges.drop_duplicates(['source', 'target']))
+
+
+if __name__ == "__main__":
+    df = read_simulation_log("../data/simulation_data_200u_200d.csv", columns=GRAPH_COLUMNS)
+
+    # Calculate the number of nodes and edges
+    num_nodes, num_edges = interaction_graph_counts(df)
+
+    print(f'{num_nodes=} and {num_edges=}')
@@ -1,54 +1,111 @@
-import datetime
-
-import dynetx as dn
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
 import pandas as pd
 
-# Assuming 'csv_data' points to the path of your CSV file
-csv_data = "../data/interaction_data.csv"
-
-# Load the data
-df = pd.read_csv(csv_data)
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-# Filter for a specific username
-desired_username = 'João Vitor Sousa'
-selected_user_df = df[df['username'] == desired_username]
-
-# Create the dynamic graph
-DG = dn.DynDiGraph()
-
-# Add nodes and dynamic edges
-for index, row in selected_user_df.iterrows():
-    person = row['username']
-    room = row['room']
-    obj = row['object']
-    activity = row['activity_type']
-    timestamp = row['timestamp']
-    timestamp = int(timestamp.timestamp())
-    timestamp_end = int(
-        (row['timestamp'].timestamp() + pd.to_datetime(row['duration']).timestamp()))
-
-    # Add nodes (you might want to manage nodes dynamically as well)
-    DG.add_node(person)
-    DG.add_node(room)
-    if pd.notna(obj):
-        DG.add_node(obj)
-
-    # Add edges with the time as an interval
-    # (here using the same time for start and end for simplicity)
-    if activity == 'movement':
-        DG.add_interaction(person, room, t=timestamp, e=timestamp_end)
-    elif activity == 'interaction':
-        DG.add_interaction(room, obj, t=timestamp, e=timestamp_end)
-
-# For visualization, extract a static snapshot at a specific time
-snapshot_time = int(pd.to_datetime('2024-01-01 00:06:04').timestamp())
-G_snapshot = DG.interactions(snapshot_time)
-
-# Draw the snapshot
-plt.figure(figsize=(12, 8))
-nx.draw(G_snapshot, with_labels=True, node_color='skyblue', edge_color='k', node_size=2000, linewidths=1, font_size=12)
-plt.title(f'Snapshot of {desired_username} Activities at {snapshot_time}')
-plt.show()
+from loader import read_simulation_log
+
+
+class TemporalIndex:
+    """Interval index over the edges of a simulation log.
+
+    Movements are person -> room edges and interactions room -> object edges, active from
+    their timestamp until timestamp + duration. The intervals are sorted by start once, and
+    since no action lasts longer than the longest duration in the log, the edges active at a
+    time t can only start in (t - max_duration, t]: every query is two binary searches plus a
+    scan of that range.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        is_movement = (df['activity_type'] == 'movement').to_numpy()
+        is_interaction = ((df['activity_type'] == 'interaction') & df['object'].notna()).to_numpy()
+        keep = is_movement | is_interaction
+        df = df[keep]
+        is_movement = is_movement[keep]
+
+        username = df['username'].astype(object).to_numpy()
+        room = df['room'].astype(object).to_numpy()
+        obj = df['object'].astype(object).to_numpy()
+        starts = df['timestamp'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        if pd.api.types.is_timedelta64_dtype(df['duration']):
+            durations = df['duration'].dt.total_seconds().to_numpy().astype(np.int64)
+        else:
+            durations = df['duration'].to_numpy(dtype=np.int64)
+
+        order = np.argsort(starts, kind='stable')
+        self.starts = starts[order]
+        self.ends = (starts + durations)[order]
+        self.usernames = username[order]
+        self.sources = np.where(is_movement, username, room)[order]
+        self.targets = np.where(is_movement, room, obj)[order]
+        self.activity_types = np.where(is_movement, 'movement', 'interaction')[order]
+        self.max_duration = int(durations.max()) if len(durations) else 0
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start: int, stop: int, username: str = None) -> np.ndarray:
+        # positions of the edges active at some point of [start, stop)
+        first = np.searchsorted(self.starts, start - self.max_duration, side='right')
+        last = np.searchsorted(self.starts, stop, side='left')
+        candidates = np.arange(first, last)
+        candidates = candidates[self.ends[first:last] > start]
+        if username is not None:
+            candidates = candidates[self.usernames[candidates] == username]
+        return candidates
+
+    def active(self, t: int, username: str = None) -> pd.DataFrame:
+        return self.edges(self.overlapping(t, t + 1, username))
+
+    def edges(self, positions: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame({
+            'source': self.sources[positions],
+            'target': self.targets[positions],
+            'activity_type': self.activity_types[positions],
+            'start': self.starts[positions],
+            'end': self.ends[positions],
+        })
+
+    def snapshot(self, t: int, username: str = None) -> nx.DiGraph:
+        return self.to_graph(self.overlapping(t, t + 1, username))
+
+    def snapshots(self, start: int, stop: int, window: int, step: int = None,
+                  username: str = None):
+        # sliding windows [t, t + window) every `step` seconds, as (t, graph) pairs
+        for t in range(start, stop, step or window):
+            yield t, self.to_graph(self.overlapping(t, t + window, username))
+
+    def to_graph(self, positions: np.ndarray) -> nx.DiGraph:
+        G = nx.DiGraph()
+        G.add_edges_from(zip(self.sources[positions],
+                             self.targets[positions],
+                             ({'type': activity_type} for activity_type in
+                              self.activity_types[positions])))
+        return G
+
+    def to_dynetx(self, username: str = None):
+        import dynetx as dn
+        DG = dn.DynDiGraph()
+        positions = np.arange(len(self))
+        if username is not None:
+            positions = positions[self.usernames == username]
+        for source, target, start, end in zip(self.sources[positions], self.targets[positions],
+                                              self.starts[positions], self.ends[positions]):
+            DG.add_interaction(source, target, t=int(start), e=int(end))
+        return DG
+
+
+if __name__ == "__main__":
+    df = read_simulation_log("../data/simulation_data_50u_200d.csv")
+    index = TemporalIndex(df)
+
+    # For visualization, extract a static snapshot at a specific time
+    desired_username = 'Alexandre da Luz'
+    snapshot_time = int(pd.Timestamp('2024-01-01 00:03:09').timestamp())
+    G_snapshot = index.snapshot(snapshot_time, username=desired_username)
+
+    # Draw the snapshot
+    plt.figure(figsize=(12, 8))
+    nx.draw(G_snapshot, with_labels=True, node_color='skyblue', edge_color='k', node_size=2000, linewidths=1, font_size=12)
+    plt.title(f'Snapshot of {desired_username} Activities at {snapshot_time}')
+    plt.show()
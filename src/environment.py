@@ -0,0 +1,166 @@
+import json
+import os
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+DEFAULT_ROOM_SIZE = (35, 50)
+
+
+class Environment:
+    """Rooms laid out on a plane, the objects in them and the doors between rooms.
+
+    Rooms have the position of their corner and a size (width and length in meters), objects
+    a position inside their room, relative to its corner. Students only move through doors, to
+    an adjacent room, with the weight of the door (1 by default). Objects without a position
+    are laid out on a grid inside their room.
+
+    Neighbors are kept per room and every room has a k-d tree of its objects, so both lookups
+    cost the same for a campus of hundreds of rooms as for a single building.
+    """
+
+    def __init__(self, rooms: list[dict], doors: list[list] = ()):
+        self.room_names = []
+        self.room_positions = {}
+        self.room_sizes = {}
+        self.objects = {}  # room -> object names, in the order of the file
+        self.object_positions = {}  # room -> (objects x 2) positions inside the room
+        self.adjacency = {}  # room -> {adjacent room: door weight}
+        self.trees = {}
+
+        object_names = set()
+        for room in rooms:
+            name = room["name"]
+            if name in self.adjacency:
+                raise ValueError(f"Room '{name}' is defined more than once")
+            size = tuple(room.get("size", DEFAULT_ROOM_SIZE))
+            objects = [obj if isinstance(obj, dict) else {"name": obj}
+                       for obj in room.get("objects", [])]
+            for obj in objects:
+                if obj["name"] in object_names:
+                    raise ValueError(f"Object '{obj['name']}' is in more than one room, "
+                                     f"object names must be unique")
+                object_names.add(obj["name"])
+
+            self.room_names.append(name)
+            self.room_positions[name] = tuple(room.get("position", (0, 0)))
+            self.room_sizes[name] = size
+            self.objects[name] = [obj["name"] for obj in objects]
+            self.object_positions[name] = object_layout(objects, size)
+            self.adjacency[name] = {}
+            if objects:
+                self.trees[name] = cKDTree(self.object_positions[name])
+
+        if not self.room_names:
+            raise ValueError("An environment needs at least one room")
+        for door in doors:
+            self.add_door(*door)
+
+    def add_door(self, room: str, other_room: str, weight: float = 1):
+        # doors go both ways
+        for name in (room, other_room):
+            if name not in self.adjacency:
+                raise ValueError(f"Door to unknown room '{name}'")
+        if room == other_room:
+            raise ValueError(f"Door from room '{room}' to itself")
+        if weight <= 0:
+            raise ValueError(f"Door between '{room}' and '{other_room}' must have a positive "
+                             f"weight, got {weight}")
+        self.adjacency[room][other_room] = weight
+        self.adjacency[other_room][room] = weight
+
+    @property
+    def rooms_and_objects(self) -> dict[str, list[str]]:
+        return {name: list(self.objects[name]) for name in self.room_names}
+
+    @property
+    def room_transitions(self) -> dict[str, dict[str, float]]:
+        # {room: {adjacent room: weight}} for Simulation, see transition_matrix in main
+        isolated = [name for name in self.room_names if not self.adjacency[name]]
+        if isolated and len(self.room_names) > 1:
+            raise ValueError(f"Rooms without doors: {isolated}")
+        return {name: dict(self.adjacency[name]) for name in self.room_names}
+
+    def neighbors(self, room: str) -> list[str]:
+        return list(self.adjacency[room])
+
+    def nearest_objects(self, room: str, point: tuple[float, float], k: int = 1) -> list[str]:
+        # the k objects of the room closest to a point inside it, closest first
+        if room not in self.trees:
+            return []
+        k = min(k, len(self.objects[room]))
+        _, indices = self.trees[room].query(point, k=k)
+        return [self.objects[room][i] for i in np.atleast_1d(indices)]
+
+    def objects_within(self, room: str, point: tuple[float, float], radius: float) -> list[str]:
+        if room not in self.trees:
+            return []
+        return [self.objects[room][i]
+                for i in sorted(self.trees[room].query_ball_point(point, radius))]
+
+    def to_dict(self) -> dict:
+        order = {name: i for i, name in enumerate(self.room_names)}
+        doors = [[room, other_room, weight]
+                 for room in self.room_names
+                 for other_room, weight in self.adjacency[room].items()
+                 if order[room] < order[other_room]]
+        return {"rooms": [{"name": name,
+                           "position": list(self.room_positions[name]),
+                           "size": list(self.room_sizes[name]),
+                           "objects": [{"name": obj, "position": position.tolist()}
+                                       for obj, position in zip(self.objects[name],
+                                                                self.object_positions[name])]}
+                          for name in self.room_names],
+                "doors": doors}
+
+
+def object_layout(objects: list[dict], size: tuple[float, float]) -> np.ndarray:
+    # positions from the file, the missing ones on the centers of a grid over the room
+    grid = int(np.ceil(np.sqrt(len(objects))))
+    positions = np.empty((len(objects), 2))
+    for i, obj in enumerate(objects):
+        if "position" in obj:
+            positions[i] = obj["position"]
+            if not (0 <= positions[i][0] <= size[0] and 0 <= positions[i][1] <= size[1]):
+                raise ValueError(f"Object '{obj['name']}' at {obj['position']} is outside its "
+                                 f"room of size {list(size)}")
+        else:
+            row, column = divmod(i, grid)
+            positions[i] = ((column + 0.5) * size[0] / grid, (row + 0.5) * size[1] / grid)
+    return positions
+
+
+def load_environment(path: str) -> Environment:
+    """Reads an environment from a JSON or YAML file ({"rooms": [...], "doors": [...]}).
+
+    YAML files need PyYAML, which is not a dependency of the project.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding="utf-8") as f:
+        if extension == ".json":
+            content = json.load(f)
+        elif extension in (".yaml", ".yml"):
+            import yaml
+            content = yaml.safe_load(f)
+        else:
+            raise ValueError(f"Unknown environment file extension '{extension}', "
+                             f"expected .json, .yaml or .yml")
+    return Environment(content["rooms"], content.get("doors", ()))
+
+
+def grid_environment(rows: int,
+                     columns: int,
+                     objects_per_room: int = 3,
+                     room_size: tuple[float, float] = DEFAULT_ROOM_SIZE) -> Environment:
+    # rows x columns rooms side by side, with doors between the rooms that share a wall, to
+    # try out large campuses
+    rooms = [{"name": f"Room {row}-{column}",
+              "position": [column * room_size[0], row * room_size[1]],
+              "size": list(room_size),
+              "objects": [f"Object {row}-{column}-{i}" for i in range(objects_per_room)]}
+             for row in range(rows) for column in range(columns)]
+    doors = [[f"Room {row}-{column}", f"Room {row}-{column + 1}"]
+             for row in range(rows) for column in range(columns - 1)]
+    doors += [[f"Room {row}-{column}", f"Room {row + 1}-{column}"]
+              for row in range(rows - 1) for column in range(columns)]
+    return Environment(rooms, doors)
@@ -0,0 +1,218 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+MOVEMENT = 0
+INTERACTION = 1
+ACTIVITY_TYPES = ["movement", "interaction"]
+
+# timestamps are epoch seconds, shown as naive datetimes like in to_frame
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def code_dtype(num_categories: int) -> np.dtype:
+    # same integer width pandas picks for categorical codes, so the codes can be reused as-is
+    for dtype in (np.int8, np.int16, np.int32):
+        if num_categories < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def categorical(codes: np.ndarray, categories: list[str]) -> pd.Categorical:
+    categories = np.array(categories, dtype=object)
+    unique_categories, unique_codes = np.unique(categories, return_inverse=True)
+    if len(unique_categories) < len(categories):
+        # repeated names share one category
+        codes = np.where(codes >= 0, unique_codes[codes], -1)
+        categories = unique_categories
+    return pd.Categorical.from_codes(codes, categories=categories, validate=False)
+
+
+def render_details(activity_type: np.ndarray,
+                   room: np.ndarray,
+                   previous_room: np.ndarray,
+                   obj: np.ndarray,
+                   room_names: list[str],
+                   object_names: list[str]) -> np.ndarray:
+    # the details strings are built once per room, object and pair of rooms moved between, for
+    # the pairs in this slice only: with hundreds of rooms most pairs never appear in it
+    num_rooms = len(room_names)
+    interactions = np.array([f"Interacted with {name}" for name in object_names] + [None],
+                            dtype=object)
+    previous_room = previous_room.astype(np.int64)
+    is_movement = activity_type == MOVEMENT
+    moves, move_codes = np.unique((previous_room[is_movement] + 1) * num_rooms
+                                  + room[is_movement], return_inverse=True)
+    from_rooms, to_rooms = np.divmod(moves, num_rooms)
+    movements = np.array([f"Moved to {room_names[to_room]}" if from_room == 0 else
+                          f"Moved from {room_names[from_room - 1]} to {room_names[to_room]}"
+                          for from_room, to_room in zip(from_rooms, to_rooms)],
+                         dtype=object)
+    details = interactions[obj]
+    details[is_movement] = movements[move_codes.ravel()]
+    return details
+
+
+class EventBuffer:
+    """Columnar store of simulation events.
+
+    Users, rooms, objects and activity types are kept as integer codes, timestamps as int64
+    epoch seconds and durations as int32 seconds. The arrays are preallocated and grow in
+    multiples of `chunk_size` rows.
+    """
+
+    def __init__(self,
+                 room_names: list[str],
+                 object_names: list[str],
+                 capacity: int = 0,
+                 chunk_size: int = 65_536):
+        self.room_names = list(room_names)
+        self.object_names = list(object_names)
+        self.chunk_size = chunk_size
+        self.names = []
+        self.engagement_levels = []
+        self.size = 0
+
+        room_dtype = code_dtype(len(self.room_names))
+        self.dtypes = {
+            "user": np.dtype(np.int32),
+            "timestamp": np.dtype(np.int64),
+            "activity_type": code_dtype(len(ACTIVITY_TYPES)),
+            "room": room_dtype,
+            "previous_room": room_dtype,
+            "object": code_dtype(len(self.object_names)),
+            "duration": np.dtype(np.int32),
+        }
+        self.arrays = {name: np.empty(capacity, dtype=dtype) for name, dtype in self.dtypes.items()}
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return len(self.arrays["timestamp"])
+
+    def add_user(self, name: str, engagement_level: int) -> int:
+        self.names.append(name)
+        self.engagement_levels.append(engagement_level)
+        return len(self.names) - 1
+
+    def add_users(self, names: list[str], engagement_level: int) -> int:
+        first_user = len(self.names)
+        self.names.extend(names)
+        self.engagement_levels.extend([engagement_level] * len(names))
+        return first_user
+
+    def reserve(self, num_rows: int):
+        needed = self.size + num_rows
+        if needed <= self.capacity:
+            return
+        new_capacity = max(needed, 2 * self.capacity)
+        new_capacity = -(-new_capacity // self.chunk_size) * self.chunk_size
+        for name, array in self.arrays.items():
+            grown = np.empty(new_capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[name] = grown
+
+    def append(self,
+               user: int,
+               timestamp: int,
+               activity_type: int,
+               room: int,
+               previous_room: int,
+               obj: int,
+               duration: int):
+        if self.size == self.capacity:
+            self.reserve(1)
+        row = self.size
+        arrays = self.arrays
+        arrays["user"][row] = user
+        arrays["timestamp"][row] = timestamp
+        arrays["activity_type"][row] = activity_type
+        arrays["room"][row] = room
+        arrays["previous_room"][row] = previous_room
+        arrays["object"][row] = obj
+        arrays["duration"][row] = duration
+        self.size += 1
+
+    def extend(self, columns: dict[str, np.ndarray]):
+        num_rows = len(columns["timestamp"])
+        self.reserve(num_rows)
+        for name, array in self.arrays.items():
+            array[self.size:self.size + num_rows] = columns[name]
+        self.size += num_rows
+
+    def sort_by_user(self):
+        order = np.argsort(self.column("user"), kind="stable")
+        for name, array in self.arrays.items():
+            array[:self.size] = array[:self.size][order]
+
+    def drop_front(self, num_rows: int):
+        # forgets rows that were already handed to a sink, keeping the capacity
+        remaining = self.size - num_rows
+        for array in self.arrays.values():
+            array[:remaining] = array[num_rows:self.size]
+        self.size = remaining
+
+    def column(self, name: str, start: int = 0, stop: int = None) -> np.ndarray:
+        stop = self.size if stop is None else min(stop, self.size)
+        return self.arrays[name][start:stop]
+
+    def columns(self) -> dict[str, np.ndarray]:
+        return {name: self.column(name) for name in self.arrays}
+
+    def details(self, start: int = 0, stop: int = None) -> np.ndarray:
+        return render_details(self.column("activity_type", start, stop),
+                              self.column("room", start, stop),
+                              self.column("previous_room", start, stop),
+                              self.column("object", start, stop),
+                              self.room_names, self.object_names)
+
+    def event(self,
+              user: int,
+              timestamp: int,
+              activity_type: int,
+              room: int,
+              previous_room: int,
+              obj: int,
+              duration: int) -> dict:
+        # one event with the values of its to_frame(details=True) row, for streaming
+        if activity_type == MOVEMENT:
+            details = (f"Moved from {self.room_names[previous_room]} to {self.room_names[room]}"
+                       if previous_room >= 0 else f"Moved to {self.room_names[room]}")
+        else:
+            details = f"Interacted with {self.object_names[obj]}"
+        return {
+            "username": self.names[user],
+            "student_id": user,
+            "engagement_level": self.engagement_levels[user],
+            "timestamp": EPOCH + datetime.timedelta(seconds=timestamp),
+            "activity_type": ACTIVITY_TYPES[activity_type],
+            "room": self.room_names[room],
+            "object": self.object_names[obj] if obj >= 0 else None,
+            "duration": datetime.timedelta(seconds=duration),
+            "details": details,
+        }
+
+    def to_frame(self, details: bool = False, start: int = 0, stop: int = None) -> pd.DataFrame:
+        # codes and timestamps are views on the buffer, only durations are widened to int64
+        user = self.column("user", start, stop)
+        data = {
+            "username": categorical(user, self.names),
+            "student_id": user,
+            "engagement_level": np.array(self.engagement_levels, dtype=np.int8)[user],
+            "timestamp": self.column("timestamp", start, stop).view("datetime64[s]"),
+            "activity_type": categorical(self.column("activity_type", start, stop),
+                                         ACTIVITY_TYPES),
+            "room": categorical(self.column("room", start, stop), self.room_names),
+            "object": categorical(self.column("object", start, stop), self.object_names),
+            "duration": self.column("duration", start, stop).astype("timedelta64[s]"),
+        }
+        if details:
+            data["details"] = self.details(start, stop)
+        return pd.DataFrame(data, copy=False)
+
+    def to_arrow(self, details: bool = False, start: int = 0, stop: int = None):
+        import pyarrow as pa
+        return pa.Table.from_pandas(self.to_frame(details, start, stop), preserve_index=False)
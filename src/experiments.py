@@ -1,4 +1,15 @@
-from main import Simulation
+import hashlib
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from accuracy import evaluate, LEVELS
+from correlation import Analysis
+from main import Simulation, random_seed
+from metrics import calculate_metrics, DEFAULT_WEIGHTS
 
 rooms_and_objects_dict = {
     "Classroom": ["Desk", "Book", "Computer"],
@@ -6,11 +17,120 @@ rooms_and_objects_dict = {
     "Café": ["Chair2", "Student", "Table"],
 }
 
+SWEEP_DIR = "../data/sweeps"
+
+
+def config_hash(config: dict) -> str:
+    # same parameters, same directory: the hash of the canonical JSON of the configuration
+    content = json.dumps(config, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+def parameter_grid(num_users: list[int],
+                   durations: list[int],
+                   seeds: list[int] = (random_seed,),
+                   start_date: str = "2024-01-01",
+                   rooms_and_objects: dict[str, list[str]] = None,
+                   backend: str = "numpy") -> list[dict]:
+    # one simulation configuration per combination
+    rooms_and_objects = rooms_and_objects or rooms_and_objects_dict
+    return [{"num_users": users, "duration": duration, "seed": seed, "start_date": start_date,
+             "rooms_and_objects": rooms_and_objects, "backend": backend}
+            for users, duration, seed in itertools.product(num_users, durations, seeds)]
+
+
+def result_row(config: dict, weights: dict[str, float], metrics_df: pd.DataFrame) -> dict:
+    row = {key: value for key, value in config.items() if key != "rooms_and_objects"}
+    row.update({f"weight_{name}": value for name, value in weights.items()})
+    row.update(Analysis(df=metrics_df).anova())
+    scores = evaluate(metrics_df)
+    row["accuracy"] = scores["accuracy"]
+    for name in ("precision", "recall", "f1"):
+        row.update({f"{name}_{level}": value for level, value in zip(LEVELS, scores[name])})
+    return {key: value.item() if hasattr(value, "item") else value for key, value in row.items()}
+
+
+def run_configuration(config: dict, weights_grid: list[dict], output_dir: str) -> list[dict]:
+    """Simulates one configuration and evaluates it for every set of weights.
+
+    Each (configuration, weights) pair has its own directory named after the hash of its
+    content, holding the metrics and a result.json that is only written once everything else
+    is; pairs with a result.json are read back, and the simulation is skipped when all of them
+    are there.
+    """
+    runs = []
+    for weights in weights_grid:
+        run_config = dict(config, weights=weights)
+        runs.append((run_config, os.path.join(output_dir, config_hash(run_config))))
+
+    rows = []
+    interaction_df = None
+    for run_config, run_dir in runs:
+        result_path = os.path.join(run_dir, "result.json")
+        if os.path.exists(result_path):
+            with open(result_path, encoding="utf-8") as f:
+                rows.append(json.load(f))
+            continue
+
+        if interaction_df is None:
+            sim = Simulation(num_users=config["num_users"],
+                             rooms_and_objects=config["rooms_and_objects"],
+                             duration=config["duration"],
+                             start_date=config["start_date"],
+                             backend=config["backend"],
+                             seed=config["seed"])
+            sim.run_simulation()
+            interaction_df = sim.interaction_data
+
+        metrics_df = calculate_metrics(interaction_df, config["rooms_and_objects"],
+                                       run_config["weights"])
+        row = dict(result_row(config, run_config["weights"], metrics_df),
+                   run=os.path.basename(run_dir))
+
+        os.makedirs(run_dir, exist_ok=True)
+        metrics_df.to_csv(os.path.join(run_dir, "metrics.csv"), index=False)
+        with open(os.path.join(run_dir, "config.json"), "w", encoding="utf-8") as f:
+            json.dump(run_config, f, ensure_ascii=False, indent=2)
+        with open(result_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(row, f, ensure_ascii=False, indent=2)
+        os.replace(result_path + ".tmp", result_path)
+        rows.append(row)
+    return rows
+
+
+def run_sweep(num_users: list[int],
+              durations: list[int],
+              seeds: list[int] = (random_seed,),
+              weights_grid: list[dict] = (DEFAULT_WEIGHTS,),
+              start_date: str = "2024-01-01",
+              rooms_and_objects: dict[str, list[str]] = None,
+              backend: str = "numpy",
+              output_dir: str = SWEEP_DIR,
+              workers: int = None) -> pd.DataFrame:
+    """Runs simulation -> metrics -> ANOVA -> accuracy over the whole grid in a process pool.
+
+    Returns one row per (num_users, duration, seed, weights) combination and writes the same
+    table to output_dir/results.csv.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    configs = parameter_grid(num_users, durations, seeds, start_date, rooms_and_objects, backend)
+    weights_grid = [dict(weights) for weights in weights_grid]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        rows = [row
+                for config_rows in executor.map(run_configuration,
+                                                configs,
+                                                itertools.repeat(weights_grid),
+                                                itertools.repeat(output_dir))
+                for row in config_rows]
+
+    results = pd.DataFrame(rows)
+    results.to_csv(os.path.join(output_dir, "results.csv"), index=False)
+    return results
 
-sim = Simulation(num_users=100,
-                 rooms_and_objects=rooms_and_objects_dict,
-                 duration=200,  # ano letivo
-                 start_date="2024-01-01",
-                 generate_csv_file=True)
 
-sim.run_simulation()
+if __name__ == "__main__":
+    # the sizes of the runs in data/
+    results = run_sweep(num_users=[50, 100, 200],
+                        durations=[100, 200, 400])
+    print(results.to_string(index=False))
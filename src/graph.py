@@ -1,49 +1,104 @@
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
 import networkx as nx
 import matplotlib.pyplot as plt
 import pandas as pd
 
-# CSV data provided
-csv_data = "../data/interaction_data.csv"
-
-# Creating a DataFrame from CSV data
-df = pd.read_csv(csv_data)
-
-# Replace 'desired_username' with the username you want to select
-desired_username = 'João Vitor Sousa'
-selected_user_df = df[df['username'] == desired_username]
-
-# Creating the graph
-G = nx.DiGraph()
-
-# Adding nodes and edges
-for i, row in selected_user_df.iterrows():
-    person = row['username']
-    room = row['room']
-    obj = row['object']
-    activity = row['activity_type']
-    detail = row['activity_type']
-
-    # Add nodes
-    G.add_node(person, type='Person', layer=0)
-    G.add_node(room, type='Room', layer=1)
-    if pd.notna(obj):
-        G.add_node(obj, type='Object', layer=2)
-
-    # Add edges
-    if activity == 'movement':
-        G.add_edge(person, room, type='Movement', detail=detail)
-    elif activity == 'interaction':
-        G.add_edge(room, obj, type='Interaction', detail=detail)
-
-# Positioning nodes for visualization
-pos = nx.multipartite_layout(G, subset_key="layer")
-
-# Drawing the graph
-plt.figure(figsize=(12, 8))
-nx.draw(G, pos, with_labels=True, node_color='skyblue', node_size=2000, edge_color='k',
-        linewidths=1, font_size=10)
-nx.draw_networkx_edge_labels(G, pos, edge_labels=nx.get_edge_attributes(G, 'detail'),
-                             font_color='red')
-# plt.title(f'Knowledge Graph of {desired_username} Activities')
-plt.savefig('../images/student_graph.png', dpi=400)
-plt.show()
+from loader import read_simulation_log
+
+# placeholder for the student node in the shared layout
+PERSON = ('person',)
+
+# set in every rendering process by init_renderer
+figure = None
+shared_positions = None
+image_dpi = None
+
+
+def student_graph(edges: pd.DataFrame) -> nx.DiGraph:
+    # person -> room for movements and room -> object for interactions
+    G = nx.DiGraph()
+    for person, room, obj, activity in zip(edges['username'], edges['room'], edges['object'],
+                                           edges['activity_type']):
+        # Add nodes
+        G.add_node(person, type='Person', layer=0)
+        G.add_node(room, type='Room', layer=1)
+        if pd.notna(obj):
+            G.add_node(obj, type='Object', layer=2)
+
+        # Add edges
+        if activity == 'movement':
+            G.add_edge(person, room, type='Movement', detail=activity)
+        elif activity == 'interaction':
+            G.add_edge(room, obj, type='Interaction', detail=activity)
+    return G
+
+
+def layer_positions(rooms: list[str], objects: list[str]) -> dict:
+    # rooms and objects sit at the same place in every image, only the person node changes
+    G = nx.DiGraph()
+    G.add_node(PERSON, layer=0)
+    G.add_nodes_from(rooms, layer=1)
+    G.add_nodes_from(objects, layer=2)
+    return nx.multipartite_layout(G, subset_key="layer")
+
+
+def draw_student_graph(G: nx.DiGraph, pos: dict, ax):
+    nx.draw(G, pos, ax=ax, with_labels=True, node_color='skyblue', node_size=2000,
+            edge_color='k', linewidths=1, font_size=10)
+    nx.draw_networkx_edge_labels(G, pos, ax=ax, edge_labels=nx.get_edge_attributes(G, 'detail'),
+                                 font_color='red')
+
+
+def init_renderer(positions: dict, dpi: int):
+    global figure, shared_positions, image_dpi
+    plt.switch_backend('Agg')
+    figure = plt.figure(figsize=(12, 8))
+    shared_positions = positions
+    image_dpi = dpi
+
+
+def render_student(task: tuple[str, pd.DataFrame, str]) -> str:
+    username, edges, path = task
+    G = student_graph(edges)
+    pos = dict(shared_positions)
+    pos[username] = shared_positions[PERSON]
+    figure.clf()
+    draw_student_graph(G, pos, figure.add_subplot())
+    figure.savefig(path, dpi=image_dpi)
+    return path
+
+
+def image_name(username: str) -> str:
+    return re.sub(r'[^\w.-]+', '_', username) + '.png'
+
+
+def render_student_graphs(df: pd.DataFrame,
+                          output_dir: str,
+                          workers: int = None,
+                          dpi: int = 400) -> list[str]:
+    """Renders the knowledge graph of every student in the log to output_dir/<username>.png."""
+    os.makedirs(output_dir, exist_ok=True)
+    # only the distinct edges of every student are sent to the renderers
+    edges = df[['username', 'activity_type', 'room', 'object']].astype(object).drop_duplicates()
+    rooms = edges['room'].dropna().unique().tolist()
+    objects = edges['object'].dropna().unique().tolist()
+    positions = layer_positions(rooms, objects)
+
+    tasks = [(username, student_edges, os.path.join(output_dir, image_name(username)))
+             for username, student_edges in edges.groupby('username', sort=False)]
+    with ProcessPoolExecutor(max_workers=workers,
+                             initializer=init_renderer,
+                             initargs=(positions, dpi)) as executor:
+        return list(executor.map(render_student, tasks, chunksize=8))
+
+
+if __name__ == "__main__":
+    # CSV data provided
+    csv_data = "../data/simulation_data_50u_200d.csv"
+    df = read_simulation_log(csv_data, columns=['username', 'activity_type', 'room', 'object'])
+
+    paths = render_student_graphs(df, "../images/student_graphs")
+    print(f"{len(paths)} student graphs saved to ../images/student_graphs")
@@ -1,81 +1,302 @@
-from datetime import datetime, timedelta
+import hashlib
+import os
+import sqlite3
+
+import numpy as np
 import pandas as pd
-from rdflib import Graph, Literal, RDF, URIRef, Namespace
-from rdflib.namespace import XSD
+from rdflib import Graph, Namespace
+from rdflib.namespace import RDF, XSD
+
+from loader import read_simulation_log
+from sqlite_store import SQLiteStore
+
+ONTOLOGY_PATH = 'ontology/ontologia_avia.ttl'
+
+# Define the namespace
+URI = "http://www.semanticweb.org/carolinadias/ontologies/2024/6/ontologia_avia#"
+EX = Namespace(URI)
+
+RDF_FORMATS = ("turtle", "nt")
+
+INSTANCE_COLUMNS = ["username", "timestamp", "activity_type", "room", "object", "duration"]
+
+# parsed graphs are kept next to their source file as a SQLiteStore database, e.g.
+# ontologia_avia.ttl.cache.sqlite, which is copied page by page into memory when loaded instead
+# of being parsed or unpickled term by term
+CACHE_SUFFIX = ".cache.sqlite"
+
+
+def file_digest(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_cached(file_path: str) -> Graph:
+    # the cache is used as long as the source keeps its mtime, or its content hash when only
+    # the mtime changed; otherwise, or when the cache cannot be read, the file is parsed again
+    # and the cache rebuilt
+    cache_path = file_path + CACHE_SUFFIX
+    stat = os.stat(file_path)
+    key = read_cache_key(cache_path)
+    digest = None
+    if key is not None and (key['mtime_ns'] != str(stat.st_mtime_ns)
+                            or key['size'] != str(stat.st_size)):
+        digest = file_digest(file_path)
+        if digest != key['sha256']:
+            key = None
+        else:
+            update_cache_key(cache_path, stat)
+    if key is not None:
+        g = open_cache(cache_path, key)
+        if g is not None:
+            return g
 
-# Function to load the existing ontology
-def load_ontology(file_path):
     g = Graph()
+    g.parse(file_path, format='turtle')
+    write_cache(cache_path, stat, digest or file_digest(file_path), g)
+    return g
+
+
+def read_cache_key(cache_path: str) -> dict:
+    # None when there is no usable cache
+    if not os.path.exists(cache_path):
+        return None
+    try:
+        connection = sqlite3.connect(f"file:{cache_path}?mode=ro", uri=True)
+        try:
+            return dict(connection.execute("SELECT name, value FROM cache_key").fetchall())
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Ignoring the ontology cache {cache_path}: {e!r}")
+        return None
+
+
+def update_cache_key(cache_path: str, stat: os.stat_result):
+    # same content under a new mtime, skip hashing it again next time
     try:
-        g.parse(file_path, format='turtle')
+        connection = sqlite3.connect(cache_path)
+        try:
+            with connection:
+                connection.executemany("UPDATE cache_key SET value = ? WHERE name = ?",
+                                       [(str(stat.st_mtime_ns), 'mtime_ns'),
+                                        (str(stat.st_size), 'size')])
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        print(f"Could not update the ontology cache: {e}")
+
+
+def open_cache(cache_path: str, key: dict) -> Graph:
+    # the cache copied into an in-memory store, so the graph can be changed without changing
+    # the cache; None when the copy does not hold what the key says, e.g. a truncated file
+    store = SQLiteStore()
+    store.open(":memory:")
+    try:
+        source = sqlite3.connect(f"file:{cache_path}?mode=ro", uri=True)
+        try:
+            source.backup(store.connection)
+        finally:
+            source.close()
+        num_triples = store.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+        num_terms = store.connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Ignoring the ontology cache {cache_path}: {e!r}")
+        store.close()
+        return None
+    if (str(num_triples), str(num_terms)) != (key.get('triples'), key.get('terms')):
+        print(f"Ignoring the ontology cache {cache_path}: it is incomplete")
+        store.close()
+        return None
+    return Graph(store=store)
+
+
+def write_cache(cache_path: str, stat: os.stat_result, digest: str, g: Graph):
+    # built next to the cache and moved over it, so readers in other processes only ever see
+    # a complete file
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    store = SQLiteStore()
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        store.open(tmp_path, create=True)
+        for prefix, namespace in g.namespaces():
+            store.bind(prefix, namespace)
+        store.addN((s, p, o, None) for s, p, o in g)
+        connection = store.connection
+        key = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': digest,
+               'triples': connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0],
+               'terms': connection.execute("SELECT COUNT(*) FROM terms").fetchone()[0]}
+        connection.execute("CREATE TABLE cache_key (name TEXT PRIMARY KEY, value TEXT)")
+        connection.executemany("INSERT INTO cache_key VALUES (?, ?)",
+                               [(name, str(value)) for name, value in key.items()])
+        store.close()
+        os.replace(tmp_path, cache_path)
+    except (OSError, sqlite3.Error) as e:
+        print(f"Could not write the ontology cache: {e}")
+        store.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+# Function to load the existing ontology
+def load_ontology(file_path, store_path: str = None, use_cache: bool = True):
+    # with a store_path the graph lives in a persistent SQLite file, and the ontology is only
+    # parsed the first time that file is created; close() the graph when done
+    if store_path is not None:
+        g = Graph(store=SQLiteStore())
+        g.open(store_path, create=True)
+        if len(g) > 0:
+            print("Ontology loaded from store.")
+            return g
+    try:
+        if use_cache:
+            ontology = parse_cached(file_path)
+        else:
+            ontology = Graph()
+            ontology.parse(file_path, format='turtle')
         print("Ontology loaded successfully.")
     except Exception as e:
         print(f"Error loading ontology: {e}")
         raise
+    if store_path is None:
+        return ontology
+    for prefix, namespace in ontology.namespaces():
+        g.bind(prefix, namespace)
+    g.addN((s, p, o, g) for s, p, o in ontology)
+    g.commit()
     return g
 
-# Read the CSV file
-csv_path = 'data/simulation_data_50u_200d copy.csv'
-df = pd.read_csv(csv_path)
 
-# Load the existing ontology
-ontology_path = 'ontology/ontologia_avia.ttl'
-g = load_ontology(ontology_path)
+def iri(term) -> str:
+    return f"<{term}>"
 
-# Define the namespace
-URI = "http://www.semanticweb.org/carolinadias/ontologies/2024/6/ontologia_avia#"
-EX = Namespace(URI)
-g.bind("ex", EX)
-
-# Helper function to calculate end time and ensure the format is correct
-def calculate_end_time(start_time_str, duration_str):
-    start_time = datetime.strptime(start_time_str, "%Y-%m-%d %H:%M:%S")
-    h, m, s = map(int, duration_str.split(':'))
-    duration = timedelta(hours=h, minutes=m, seconds=s)
-    end_time = start_time + duration
-    return end_time.strftime("%Y-%m-%dT%H:%M:%S")
-
-# Iterate over the DataFrame rows and add instances
-for index, row in df.iterrows():
-    # Define URIs
-    student_uri = URIRef(f"{URI}{row['username'].replace(' ', '_')}")
-    room_uri = URIRef(f"{URI}{row['room'].replace(' ', '_')}")
-    action_uri = URIRef(f"{URI}action_{index}")
-    
-    if pd.notna(row['object']):
-        object_uri = URIRef(f"{URI}{row['object'].replace(' ', '_')}")
-    else:
-        object_uri = None
-    
-    # Convert timestamp to xsd:dateTime format
-    start_time = Literal(row['timestamp'].replace(' ', 'T'), datatype=XSD.dateTime)
-    end_time = Literal(calculate_end_time(row['timestamp'], row['duration']), datatype=XSD.dateTime)
-    
-    # Add Action instance and properties
-    if row['activity_type'] == 'movement':
-        g.add((action_uri, RDF.type, EX.Movement))
-        g.add((action_uri, EX.has_room, room_uri))
-    elif row['activity_type'] == 'interaction' and object_uri:
-        g.add((action_uri, RDF.type, EX.Interaction))
-        g.add((action_uri, EX.has_object, object_uri))
-    
-    g.add((action_uri, EX.actionStartTime, start_time))
-    g.add((action_uri, EX.actionEndTime, end_time))
-    g.add((student_uri, EX.has_action, action_uri))
-    
-    # Add Student, Room, and Object instances if they don't already exist
-    g.add((student_uri, RDF.type, EX.Student))
-    g.add((student_uri, EX.id, Literal(row['username'], datatype=XSD.string)))
-    # g.add((student_uri, EX.description, Literal(row['details'], datatype=XSD.string)))
-    
-    g.add((room_uri, RDF.type, EX.Room))
-    g.add((room_uri, EX.id, Literal(row['room'], datatype=XSD.string)))
-    
-    if object_uri:
-        g.add((object_uri, RDF.type, EX.interactableObject))
-        g.add((object_uri, EX.id, Literal(row['object'], datatype=XSD.string)))
-
-# Save the updated ontology with instances
-output_path = 'ontology/ontologia_avia_with_instances_copy.ttl'
-g.serialize(output_path, format='turtle')
-print(f"Updated ontology with instances saved to {output_path}")
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def literal(values: pd.Series, datatype) -> pd.Series:
+    escaped = values.astype(str).str.replace('\\', '\\\\').str.replace('"', '\\"')
+    return '"' + escaped + f'"^^{iri(datatype)}'
+
+
+def entity_iris(names: pd.Series) -> pd.Series:
+    # IRIs are built once per category and then looked up for every row
+    categories = names.cat.categories.to_series().astype(str)
+    category_iris = ("<" + URI + categories.str.replace(' ', '_') + ">").to_numpy(dtype=object)
+    codes = names.cat.codes.to_numpy()
+    return pd.Series(np.where(codes >= 0, category_iris[codes], ""), index=names.index)
+
+
+def entity_lines(names: pd.Series, rdf_type, seen: set) -> list[str]:
+    # Student, Room and Object instances are only written the first time they appear
+    lines = []
+    names = names[~names.duplicated() & names.notna()]
+    for name, entity_iri in zip(names, entity_iris(names)):
+        if name in seen:
+            continue
+        seen.add(name)
+        lines.append(f"{entity_iri} {iri(RDF.type)} {iri(rdf_type)} .\n")
+        lines.append(f'{entity_iri} {iri(EX.id)} "{escape(name)}"^^{iri(XSD.string)} .\n')
+    return lines
+
+
+def action_lines(chunk: pd.DataFrame,
+                 first_index: int,
+                 action_prefix: str = "action_") -> np.ndarray:
+    action = ("<" + URI + action_prefix +
+              pd.Series(np.arange(first_index, first_index + len(chunk)), index=chunk.index)
+              .astype(str) + ">")
+    student = entity_iris(chunk['username'])
+    room = entity_iris(chunk['room'])
+    obj = entity_iris(chunk['object'])
+    start_time = literal(chunk['timestamp'].dt.strftime("%Y-%m-%dT%H:%M:%S"), XSD.dateTime)
+    end_time = literal((chunk['timestamp'] + pd.to_timedelta(chunk['duration'], unit='s'))
+                       .dt.strftime("%Y-%m-%dT%H:%M:%S"), XSD.dateTime)
+
+    is_movement = (chunk['activity_type'] == 'movement').to_numpy()
+    is_interaction = ((chunk['activity_type'] == 'interaction') &
+                      chunk['object'].notna()).to_numpy()
+    action_type = np.where(is_movement, iri(EX.Movement), iri(EX.Interaction))
+    target = np.where(is_movement, iri(EX.has_room) + " " + room, iri(EX.has_object) + " " + obj)
+
+    # one row of triples per action, the type and target only for movements and interactions
+    # with an object
+    typed = is_movement | is_interaction
+    triples = np.column_stack([
+        np.where(typed, action + f" {iri(RDF.type)} " + action_type + " .\n", ""),
+        np.where(typed, action + " " + target + " .\n", ""),
+        action + f" {iri(EX.actionStartTime)} " + start_time + " .\n",
+        action + f" {iri(EX.actionEndTime)} " + end_time + " .\n",
+        student + f" {iri(EX.has_action)} " + action + " .\n",
+    ])
+    return triples.ravel()
+
+
+def instance_lines(csv_path: str, chunksize: int, action_prefix: str = "action_"):
+    seen_students, seen_rooms, seen_objects = set(), set(), set()
+    num_actions = 0
+    for chunk in read_simulation_log(csv_path, columns=INSTANCE_COLUMNS, chunksize=chunksize):
+        lines = list(action_lines(chunk, num_actions, action_prefix))
+        lines.extend(entity_lines(chunk['username'], EX.Student, seen_students))
+        lines.extend(entity_lines(chunk['room'], EX.Room, seen_rooms))
+        lines.extend(entity_lines(chunk['object'], EX.interactableObject, seen_objects))
+        num_actions += len(chunk)
+        yield lines
+
+
+def export_instances(csv_path: str,
+                     output_path: str,
+                     ontology_path: str = ONTOLOGY_PATH,
+                     rdf_format: str = "turtle",
+                     chunksize: int = 100_000):
+    """Writes the ontology followed by one instance per logged action, chunk by chunk.
+
+    The instance triples are written directly as N-Triples lines, which are also valid Turtle,
+    so the output never has to be held in memory as a Graph.
+    """
+    if rdf_format not in RDF_FORMATS:
+        raise ValueError(f"Unknown format '{rdf_format}', expected one of {RDF_FORMATS}")
+
+    ontology = load_ontology(ontology_path)
+    ontology.bind("ex", EX)
+
+    with open(output_path, 'w', encoding='utf-8') as output:
+        output.write(ontology.serialize(format=rdf_format))
+        output.write("\n")
+        for lines in instance_lines(csv_path, chunksize):
+            output.writelines(lines)
+
+    print(f"Updated ontology with instances saved to {output_path}")
+
+
+def store_instances(csv_path: str,
+                    store_path: str,
+                    ontology_path: str = ONTOLOGY_PATH,
+                    run_name: str = None,
+                    chunksize: int = 100_000):
+    """Appends the instances of a simulation log to a persistent SQLite triple store.
+
+    `run_name` keeps the action IRIs of different simulation runs apart, e.g. "50u_200d" gives
+    ex:action_50u_200d_0, ex:action_50u_200d_1, ...
+    """
+    g = load_ontology(ontology_path, store_path=store_path)
+    g.bind("ex", EX)
+    action_prefix = f"action_{run_name}_" if run_name else "action_"
+    try:
+        for lines in instance_lines(csv_path, chunksize, action_prefix):
+            chunk_graph = Graph().parse(data="".join(lines), format="nt")
+            g.addN((s, p, o, g) for s, p, o in chunk_graph)
+            g.commit()
+    finally:
+        g.close()
+    print(f"Instances added to the store at {store_path}")
+
+
+if __name__ == "__main__":
+    export_instances(csv_path='data/simulation_data_50u_200d copy.csv',
+                     output_path='ontology/ontologia_avia_with_instances_copy.ttl')
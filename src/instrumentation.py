@@ -0,0 +1,128 @@
+import contextlib
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+
+
+class Instrumentation:
+    """Per-phase timings, event counts and memory peaks, shared by Simulation, Metrics and Analysis.
+
+    Phases with the same name are added up, e.g. one "day_loop" for all the blocks of a
+    simulation. With trace_memory, tracemalloc runs while any phase is open and every phase
+    records how far its traced memory peaked above where it started. Each hook is called with
+    the name of a phase and returns a context manager the phase runs in, see cprofile_hook.
+
+    A disabled instrumentation records nothing, so the instrumented classes can always call it.
+    """
+
+    def __init__(self, enabled: bool = True, trace_memory: bool = False, hooks=()):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.hooks = list(hooks)
+        self.phases = {}
+        self.open_phases = []  # [start memory, highest peak of the nested phases] per open phase
+        self.started_tracing = False
+
+    def record(self, name: str) -> dict:
+        return self.phases.setdefault(name, {"calls": 0, "seconds": 0.0, "events": 0,
+                                             "memory_peak_mb": None})
+
+    def count(self, name: str, events: int):
+        if self.enabled:
+            self.record(name)["events"] += int(events)
+
+    @contextlib.contextmanager
+    def phase(self, name: str, events: int = 0):
+        if not self.enabled:
+            yield
+            return
+        with contextlib.ExitStack() as stack:
+            for hook in self.hooks:
+                stack.enter_context(hook(name))
+            self.start_memory()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                seconds = time.perf_counter() - start
+                peak = self.stop_memory()
+                record = self.record(name)
+                record["calls"] += 1
+                record["seconds"] += seconds
+                record["events"] += events
+                if peak is not None:
+                    record["memory_peak_mb"] = max(record["memory_peak_mb"] or 0,
+                                                   peak / (1 << 20))
+
+    def start_memory(self):
+        if not self.trace_memory:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        current, peak = tracemalloc.get_traced_memory()
+        if self.open_phases:
+            # keep the peak reached so far by the enclosing phase before resetting it
+            self.open_phases[-1][1] = max(self.open_phases[-1][1], peak)
+        tracemalloc.reset_peak()
+        self.open_phases.append([current, 0])
+
+    def stop_memory(self):
+        if not self.trace_memory:
+            return None
+        start, nested_peak = self.open_phases.pop()
+        peak = max(tracemalloc.get_traced_memory()[1], nested_peak)
+        if self.open_phases:
+            self.open_phases[-1][1] = max(self.open_phases[-1][1], peak)
+        elif self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
+        return peak - start
+
+    def to_dict(self) -> dict:
+        report = {}
+        for name, record in self.phases.items():
+            report[name] = dict(record)
+            if record["events"] and record["seconds"] > 0:
+                report[name]["events_per_second"] = record["events"] / record["seconds"]
+        return report
+
+    def to_json(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def summary(self) -> str:
+        lines = []
+        for name, record in self.to_dict().items():
+            line = f"{name}: {record['seconds']:.3f} s"
+            if record["calls"] > 1:
+                line += f" over {record['calls']} calls"
+            if record["events"]:
+                line += (f", {record['events']} events"
+                         f" ({record.get('events_per_second', 0):,.0f}/s)")
+            if record["memory_peak_mb"] is not None:
+                line += f", peak {record['memory_peak_mb']:.1f} MB"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def cprofile_hook(output_dir: str, phases: list[str]):
+    # profiles the given phases to output_dir/<phase>.prof, for pstats or snakeviz; a phase that
+    # runs several times keeps the profile of its last call. Only one profiler can be active at
+    # a time, so the phases must not be nested in each other
+    @contextlib.contextmanager
+    def hook(name: str):
+        if name not in phases:
+            yield
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            os.makedirs(output_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(output_dir, f"{name}.prof"))
+    return hook
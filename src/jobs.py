@@ -0,0 +1,101 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    """A pipeline run in the background, with its progress and a cancellation flag.
+
+    The function of the job gets the job itself as its first argument and calls `report` with
+    its progress; once the job is cancelled, the next `report` raises JobCancelled.
+    """
+
+    def __init__(self, key, label: str = None):
+        self.key = key
+        self.label = label or str(key)
+        self.future = None
+        self.stage = "Queued"
+        self.done = 0
+        self.total = 0
+        self.cancelled = threading.Event()
+
+    def report(self, done: int, total: int, stage: str = None):
+        if self.cancelled.is_set():
+            raise JobCancelled(self.label)
+        self.done = done
+        self.total = total
+        if stage is not None:
+            self.stage = stage
+
+    def cancel(self):
+        self.cancelled.set()
+        self.future.cancel()
+
+    @property
+    def fraction(self) -> float:
+        return min(self.done / self.total, 1.0) if self.total else 0.0
+
+    @property
+    def status(self) -> str:
+        # queued, running, done, cancelled or failed
+        if self.future.cancelled():
+            return "cancelled"
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if isinstance(self.future.exception(), JobCancelled):
+            return "cancelled"
+        return "failed" if self.future.exception() is not None else "done"
+
+    def result(self):
+        return self.future.result()
+
+    def error(self):
+        try:
+            return self.future.exception()
+        except CancelledError:
+            return None
+
+
+class JobRunner:
+    """Runs jobs on a thread pool, at most `max_workers` at a time and the rest queued.
+
+    Jobs are kept by key, so submitting the same key again returns the job already queued,
+    running or finished instead of starting a new one; only the `max_finished` most recent
+    finished jobs are kept.
+    """
+
+    def __init__(self, max_workers: int = 2, max_finished: int = 8):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.max_finished = max_finished
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def submit(self, key, function, *args, label: str = None) -> Job:
+        with self.lock:
+            job = self.jobs.get(key)
+            if job is not None and job.status not in ("cancelled", "failed"):
+                return job
+            job = Job(key, label)
+            job.future = self.executor.submit(function, job, *args)
+            self.jobs[key] = job
+            self.prune()
+            return job
+
+    def get(self, key) -> Job:
+        return self.jobs.get(key)
+
+    def prune(self):
+        finished = [key for key, job in self.jobs.items() if job.future.done()]
+        for key in finished[:max(len(finished) - self.max_finished, 0)]:
+            del self.jobs[key]
+
+    def active(self) -> list[Job]:
+        return [job for job in self.jobs.values() if not job.future.done()]
+
+    def shutdown(self):
+        for job in self.active():
+            job.cancel()
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# schema of the files written by Simulation
+SIMULATION_DTYPES = {
+    "username": "category",
+    "student_id": "int32",
+    "engagement_level": "int8",
+    "timestamp": "string",
+    "activity_type": "category",
+    "room": "category",
+    "object": "category",
+    "duration": "category",
+    "details": "string",
+}
+
+# logs written before student ids were added have no student_id column
+OPTIONAL_COLUMNS = {"student_id"}
+
+# columns only read to make up for a missing optional one: details tells apart the moves of
+# students that share a name in logs without student_id, and is skipped in the others
+FALLBACK_COLUMNS = {"details": "student_id"}
+
+METRICS_COLUMNS = ["username", "student_id", "engagement_level", "activity_type", "object",
+                   "duration"]
+
+
+def duration_seconds(durations: pd.Series) -> np.ndarray:
+    # "HH:MM:SS" strings only take a few hundred distinct values, parse each of them once
+    durations = durations.astype("category")
+    seconds = pd.to_timedelta(durations.cat.categories.astype(str)).total_seconds()
+    return seconds.to_numpy()[durations.cat.codes.to_numpy()].astype(np.int64)
+
+
+def read_simulation_log(path: str,
+                        columns: list[str] = None,
+                        engine: str = None,
+                        chunksize: int = None):
+    """Reads a simulation log with the known dtypes.
+
+    Categorical username, room, object and activity_type, `timestamp` as datetime64 and
+    `duration` as integer seconds. `columns` limits the columns that are loaded and `engine`
+    can be set to "pyarrow" for csv files. Parquet and arrow ipc files are read by extension.
+    With `chunksize` an iterator of typed DataFrames is returned instead.
+    """
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        columns = present_columns(columns, pq.read_schema(path).names)
+        return convert_types(pd.read_parquet(path, columns=columns))
+    if path.endswith(".arrow"):
+        import pyarrow as pa
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+        if columns is not None:
+            table = table.select(present_columns(columns, table.column_names))
+        return convert_types(table.to_pandas())
+
+    columns = present_columns(columns, pd.read_csv(path, nrows=0).columns)
+    dtype = {name: SIMULATION_DTYPES[name] for name in columns or SIMULATION_DTYPES}
+    reader = pd.read_csv(path,
+                         usecols=columns,
+                         dtype=dtype,
+                         engine=engine,
+                         chunksize=chunksize)
+    if chunksize is not None:
+        return (convert_types(chunk) for chunk in reader)
+    return convert_types(reader)
+
+
+def present_columns(columns: list[str], file_columns: list[str]) -> list[str]:
+    # drops the optional columns the file does not have and the fallbacks of those it has, the
+    # others are left to the reader
+    if columns is None:
+        return None
+    return [name for name in columns
+            if (name in file_columns or name not in OPTIONAL_COLUMNS)
+            and not (FALLBACK_COLUMNS.get(name) in columns
+                     and FALLBACK_COLUMNS.get(name) in file_columns)]
+
+
+def convert_types(df: pd.DataFrame) -> pd.DataFrame:
+    if "timestamp" in df and not pd.api.types.is_datetime64_any_dtype(df["timestamp"]):
+        df["timestamp"] = pd.to_datetime(df["timestamp"], format=TIMESTAMP_FORMAT)
+    if "duration" in df:
+        if pd.api.types.is_timedelta64_dtype(df["duration"]):
+            df["duration"] = df["duration"].dt.total_seconds().astype(np.int64)
+        elif not pd.api.types.is_integer_dtype(df["duration"]):
+            df["duration"] = duration_seconds(df["duration"])
+    for name in ("username", "activity_type", "room", "object"):
+        if name in df and not isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = df[name].astype("category")
+    return df
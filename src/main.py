@@ -1,27 +1,117 @@
-from faker import Faker
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
 import datetime
+import heapq
+from itertools import islice, repeat
+import numpy as np
 import pandas as pd
 import random
 import time
 
+from events import EventBuffer, MOVEMENT, INTERACTION
+from environment import Environment
+from instrumentation import Instrumentation
+from metrics import MetricsAccumulator
+from names import unique_names
+from numpy_backend import draw_login_schedule, simulate_cohort, LOGIN_MODELS, SECONDS_PER_DAY
+from sinks import EventSink, FORMATS
+
 random_seed = 87
-random.seed(random_seed)
-fake = Faker(locale='pt_BR')
-Faker.seed(random_seed)
+
+ENGAGEMENT_PARAMETERS = {
+    1: {
+        "num_interactions": (1, 3),
+        "interaction_probability": 0.5,
+        "movement_range": (60, 300),
+        "interaction_range": (30, 90),
+        "login_frequency": 7,
+    },
+    2: {
+        "num_interactions": (2, 5),
+        "interaction_probability": 0.7,
+        "movement_range": (120, 240),
+        "interaction_range": (60, 180),
+        "login_frequency": 4,
+    },
+    3: {
+        "num_interactions": (3, 7),
+        "interaction_probability": 0.9,
+        "movement_range": (300, 600),
+        "interaction_range": (180, 300),
+        "login_frequency": 2,
+    },
+}
+
+# share of the students in each engagement level
+ENGAGEMENT_SHARES = {1: 0.2, 2: 0.5, 3: 0.3}
+
+BACKENDS = ("python", "numpy")
+
+
+def student_seed(seed: int, index: int) -> int:
+    # independent stream per student, whatever shard the student is simulated in
+    return int(np.random.SeedSequence([seed, index]).generate_state(1, np.uint64)[0])
+
+
+def simulate_shard(simulation: "Simulation", blocks: list[tuple[int, int, int]]):
+    return [simulation.simulate_block(*block) for block in blocks]
+
+
+# order of the values of a streamed event, timestamp first so the streams merge on it
+STREAM_FIELDS = ("timestamp", "user", "activity_type", "room", "previous_room", "object",
+                 "duration")
+
+
+def time_ordered(columns: dict[str, np.ndarray], chunk_size: int = 10_000):
+    # the events of a block as tuples in (timestamp, user) order, converted chunk by chunk
+    order = np.lexsort((columns["user"], columns["timestamp"]))
+    for start in range(0, len(order), chunk_size):
+        rows = order[start:start + chunk_size]
+        yield from zip(*(columns[name][rows].tolist() for name in STREAM_FIELDS))
+
+
+class ReplayClock:
+    """Paces a stream so that its timestamps go by `speed` times faster than real time.
+
+    The first event is due right away, and every later one once the time between the two
+    timestamps, divided by speed, has passed on the wall clock.
+    """
+
+    def __init__(self, speed: float):
+        if speed <= 0:
+            raise ValueError(f"Replay speed must be positive, got {speed}")
+        self.speed = speed
+        self.started = None
+        self.first_timestamp = None
+
+    def delay(self, timestamp: datetime.datetime) -> float:
+        # seconds to wait before the event at timestamp is due
+        now = time.monotonic()
+        if self.started is None:
+            self.started, self.first_timestamp = now, timestamp
+        due = self.started + (timestamp - self.first_timestamp).total_seconds() / self.speed
+        return max(0.0, due - now)
 
 
 class Student:
-    def __init__(self, name: str, engagement_level: int):
+    def __init__(self,
+                 name: str,
+                 engagement_level: int,
+                 index: int = 0,
+                 events: EventBuffer = None,
+                 rng: random.Random = None):
         self.name = name
         self.engagement_level = engagement_level
+        self.index = index  # user code in the event buffer
+        self.rng = rng or random.Random()
 
         self.current_room = None
-        self.interaction_log = []
+        self.events = events
         self.interaction_probability = 0
         self.num_interactions = 0
         self.login_frequency = None
-        self.login_days = set()
-        self.timestamp = None
+        self.login_days = None  # boolean array, True on the days the student logs in
+        self.timestamp = None  # epoch seconds
         self.movement_range = (0, 0)
         self.interaction_range = (0, 0)
         self.interaction_duration = None
@@ -29,173 +119,471 @@ class Student:
 
         self.user_data()
 
-    def calculate_login_days(self, simulation_start: datetime.datetime, total_days: int):
-        login_days = random.sample(range(total_days), total_days // 2)
-        for day in login_days:
-            login_time = fake.date_time_between_dates(
-                datetime.datetime.combine(simulation_start + datetime.timedelta(days=day),
-                                          datetime.time(0)),
-                datetime.datetime.combine(simulation_start + datetime.timedelta(days=day),
-                                          datetime.time(23, 59)))
-            self.login_days.add(login_time.strftime("%m/%d/%Y"))
-
     def user_data(self):
-        match self.engagement_level:
-            case 1:
-                self.num_interactions = random.randint(1, 3)
-                self.interaction_probability = 0.5
-                self.movement_range = (60, 300)
-                self.interaction_range = (30, 90)
-                self.login_frequency = 7
-            case 2:
-                self.num_interactions = random.randint(2, 5)
-                self.interaction_probability = 0.7
-                self.movement_range = (120, 240)
-                self.interaction_range = (60, 180)
-                self.login_frequency = 4
-            case 3:
-                self.num_interactions = random.randint(3, 7)
-                self.interaction_probability = 0.9
-                self.movement_range = (300, 600)
-                self.interaction_range = (180, 300)
-                self.login_frequency = 2
-
-    def move_and_interact(self, rooms):
+        parameters = ENGAGEMENT_PARAMETERS[self.engagement_level]
+        self.num_interactions = self.rng.randint(*parameters["num_interactions"])
+        self.interaction_probability = parameters["interaction_probability"]
+        self.movement_range = parameters["movement_range"]
+        self.interaction_range = parameters["interaction_range"]
+        self.login_frequency = parameters["login_frequency"]
+
+    def move_and_interact(self, room_table: "RoomTable"):
         for _ in range(self.num_interactions):
-            if not self.current_room or random.random() > self.interaction_probability:
-                self.move(rooms)
+            if not self.current_room or self.rng.random() > self.interaction_probability:
+                self.move(room_table)
             self.interact()
 
-    def move(self, rooms):
+    def move(self, room_table: "RoomTable"):
         previous_room = self.current_room
-        self.current_room = random.choice(
-            [room for room in rooms if room != self.current_room]
-        )
-        self.movement_frequency = datetime.timedelta(seconds=random.randint(*self.movement_range))
+        self.current_room = room_table.next_room(self.rng, self.current_room)
+        self.movement_frequency = self.rng.randint(*self.movement_range)
         self.timestamp += self.movement_frequency
-        self.interaction_log.append({
-            "username": self.name,
-            "engagement_level": self.engagement_level,
-            "timestamp": self.timestamp,
-            "activity_type": "movement",
-            "room": self.current_room.name,
-            "object": None,
-            "duration": self.movement_frequency,
-            "details": f"Moved {f'from {previous_room.name} ' if previous_room else ''}to"
-                       f" {self.current_room.name}"
-        })
+        self.events.append(self.index,
+                           self.timestamp,
+                           MOVEMENT,
+                           self.current_room.index,
+                           previous_room.index if previous_room else -1,
+                           -1,
+                           self.movement_frequency)
 
     def interact(self):
-        if not self.current_room.objects:
+        if not self.current_room.object_ids:
             return
-        obj = random.choice(self.current_room.objects)
-        self.interaction_duration = datetime.timedelta(
-            seconds=random.randint(*self.interaction_range))
+        obj = self.rng.choice(self.current_room.object_ids)
+        self.interaction_duration = self.rng.randint(*self.interaction_range)
         self.timestamp += self.interaction_duration
-        self.interaction_log.append({
-            "username": self.name,
-            "engagement_level": self.engagement_level,
-            "timestamp": self.timestamp,
-            "activity_type": "interaction",
-            "room": self.current_room.name,
-            "object": obj.name,
-            "duration": self.interaction_duration,
-            "details": f"Interacted with {obj.name}"
-        })
+        self.events.append(self.index,
+                           self.timestamp,
+                           INTERACTION,
+                           self.current_room.index,
+                           self.current_room.index,
+                           obj,
+                           self.interaction_duration)
 
 
 class Object:
-    def __init__(self, name: str):
+    def __init__(self, name: str, index: int = 0, position: tuple[float] = None):
         self.name = name
+        self.index = index
+        self.position = position  # inside its room, from the corner of the room
 
 
 class Room:
     def __init__(self,
                  name: str,
                  objects: list[Object],
-                 size: tuple[int] = (35, 50)):
+                 size: tuple[int] = (35, 50),
+                 index: int = 0,
+                 position: tuple[float] = None):
         self.name = name
         self.objects = objects
+        self.object_ids = tuple(obj.index for obj in objects)
         self.size = size  # width and length in meters
+        self.index = index
+        self.position = position  # of its corner in the environment
+
+
+def transition_matrix(room_names: list[str],
+                      room_transitions: dict[str, dict[str, float]]) -> np.ndarray:
+    """Rooms x rooms matrix of move probabilities from {room: {next room: weight}}.
+
+    Rooms without an entry move uniformly to any other room, next rooms missing from an entry
+    have weight 0, and a student never "moves" to the room they are in.
+    """
+    num_rooms = len(room_names)
+    positions = {name: i for i, name in enumerate(room_names)}
+    weights = np.ones((num_rooms, num_rooms))
+    for from_room, next_rooms in room_transitions.items():
+        if from_room not in positions or any(name not in positions for name in next_rooms):
+            raise ValueError(f"Unknown room in the transitions of '{from_room}', "
+                             f"expected rooms among {room_names}")
+        weights[positions[from_room]] = 0
+        for to_room, weight in next_rooms.items():
+            if weight < 0:
+                raise ValueError(f"Negative transition weight from '{from_room}' to '{to_room}'")
+            weights[positions[from_room], positions[to_room]] = weight
+    np.fill_diagonal(weights, 0)
+    totals = weights.sum(axis=1)
+    if (totals <= 0).any():
+        raise ValueError(f"No room to move to from "
+                         f"{[room_names[i] for i in np.flatnonzero(totals <= 0)]}")
+    return weights / totals[:, None]
+
+
+class RoomTable:
+    """Where a student can move next, precomputed per room so every move is a single draw.
+
+    Without transition weights the next room is uniform among the other rooms, otherwise it is
+    drawn from the row of the current room in the transition matrix, among the rooms it has a
+    positive weight for, e.g. only the adjacent rooms of an Environment.
+    """
+
+    def __init__(self, rooms: list[Room], transition_weights: np.ndarray = None):
+        self.rooms = tuple(rooms)
+        self.cum_weights = None
+        if transition_weights is None:
+            self.alternatives = [tuple(other for other in rooms if other is not room)
+                                 for room in rooms]
+        else:
+            next_rooms = [np.flatnonzero(transition_weights[room.index]) for room in rooms]
+            self.alternatives = [tuple(self.rooms[i] for i in indices) for indices in next_rooms]
+            self.cum_weights = [np.cumsum(transition_weights[room.index, indices]).tolist()
+                                for room, indices in zip(rooms, next_rooms)]
+
+    def next_room(self, rng: random.Random, current_room: Room = None) -> Room:
+        if current_room is None:
+            return rng.choice(self.rooms)
+        if not self.alternatives[current_room.index]:
+            # a single room, moving means staying in it
+            return current_room
+        if self.cum_weights is None:
+            return rng.choice(self.alternatives[current_room.index])
+        return rng.choices(self.alternatives[current_room.index],
+                           cum_weights=self.cum_weights[current_room.index])[0]
 
 
 class Simulation:
     def __init__(
             self,
             num_users: int,
-            rooms_and_objects: dict[str, list[str]],
+            rooms_and_objects: dict[str, list[str]] | Environment,
             duration: int,
             start_date: str = "2024-01-01",
             generate_csv_file: bool = False,
-            df_path: str = None):
+            df_path: str = None,
+            backend: str = "python",
+            seed: int = random_seed,
+            block_size: int = 10_000,
+            workers: int = 1,
+            output_format: str = "csv",
+            compression: str = None,
+            chunk_size: int = 100_000,
+            keep_events: bool = True,
+            accumulate_metrics: bool = False,
+            instrumentation: Instrumentation = None,
+            login_model: str = "frequency",
+            room_transitions: dict[str, dict[str, float]] = None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+        if login_model not in LOGIN_MODELS:
+            raise ValueError(f"Unknown login model '{login_model}', "
+                             f"expected one of {LOGIN_MODELS}")
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format '{output_format}', "
+                             f"expected one of {tuple(FORMATS)}")
         self.num_users = num_users
+        # an Environment brings the positions of the rooms and objects, and students only move
+        # to adjacent rooms unless room_transitions says otherwise
+        self.environment = None
+        if isinstance(rooms_and_objects, Environment):
+            self.environment = rooms_and_objects
+            rooms_and_objects = self.environment.rooms_and_objects
+            if room_transitions is None and len(rooms_and_objects) > 1:
+                room_transitions = self.environment.room_transitions
         self.rooms_and_objects = rooms_and_objects
         self.duration = duration
         self.generate_csv_file = generate_csv_file
-        self.users = []
         self.rooms = []
         self.objects = []
-        self.interaction_data = []
+        self.events = None
+        self.interaction_data = None
         self.start_date = datetime.datetime.strptime(start_date, "%Y-%m-%d")
         self.df_path = df_path
+        self.backend = backend
+        self.seed = seed
+        self.block_size = block_size
+        self.workers = workers
+        self.output_format = output_format
+        self.compression = compression
+        self.chunk_size = chunk_size
+        self.keep_events = keep_events
+        self.accumulate_metrics = accumulate_metrics
+        # "frequency": students log in on a day with probability 1 / login_frequency of their
+        # engagement level, "half": on half of the days
+        self.login_model = login_model
+        # {room: {next room: weight}}, uniform moves when None, see transition_matrix
+        self.room_transitions = room_transitions
+        self.transition_weights = None
+        self.room_table = None
+        self.metrics = None
+        self.sink = None
+        self.flushed = 0  # events already written to the sink
+        self.progress = None
+        self.simulated_days = 0
+        # phases run in worker processes are not recorded, only the blocks they return
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
 
-    def run_simulation(self):
+    def __getstate__(self):
+        # the sink, the accumulator, the progress callback and the instrumentation stay in the
+        # parent process
+        state = self.__dict__.copy()
+        state.update(sink=None, metrics=None, progress=None,
+                     instrumentation=Instrumentation(enabled=False))
+        return state
+
+    def run_simulation(self, progress=None):
+        """Runs the simulation, calling progress(done, total) as simulated student-days add up.
+
+        The callback is called from the thread that runs the simulation, after every simulated
+        day of the python backend and after every block of the numpy backend or of a worker
+        process. An exception raised by it stops the simulation.
+        """
         print("Starting simulation...")
         start_time = time.time()
-        self.create_users()
-        self.create_rooms_and_objects()
+        self.progress = progress
+        self.simulated_days = 0
+        with self.instrumentation.phase("run_simulation"):
+            self.create_rooms_and_objects()
+            self.create_users()
+            if self.accumulate_metrics:
+                self.metrics = MetricsAccumulator(self.events.names,
+                                                  self.events.engagement_levels,
+                                                  self.events.object_names)
 
-        for day in range(self.duration):
-            current_date = self.start_date + datetime.timedelta(days=day)
-            for user in self.users:
-                user.timestamp = current_date
-                if current_date.strftime("%m/%d/%Y") in user.login_days:
-                    user.move_and_interact(self.rooms)
-
-        self.collect_data()
-        if self.generate_csv_file:
-            self.save_to_csv()
+            # the output file is written chunk by chunk while the blocks are simulated
+            self.sink = self.open_sink() if self.generate_csv_file else None
+            try:
+                with self.instrumentation.phase("simulate"):
+                    for columns in self.simulated_blocks():
+                        self.instrumentation.count("simulate", len(columns["user"]))
+                        if self.metrics is not None:
+                            self.metrics.update(columns)
+                        self.events.extend(columns)
+                        self.flush()
+                    self.flush(final=True)
+            finally:
+                if self.sink is not None:
+                    self.sink.close()
+
+            self.collect_data()
         end_time = time.time()
         print(f"Simulation completed in {end_time - start_time} seconds.")
 
-    def create_users(self):
-        num_users_low_engagement = int(self.num_users * 0.2)
-        num_users_average_engagement = int(self.num_users * 0.5)
-        num_users_high_engagement = int(self.num_users * 0.3)
+    def simulated_blocks(self):
+        # every block draws from its own seed, so the log is the same for any number of workers
+        blocks = self.blocks()
+        if self.workers > 1 and len(blocks) > 1:
+            shard_size = -(-len(blocks) // self.workers)
+            shards = [blocks[i:i + shard_size] for i in range(0, len(blocks), shard_size)]
+            with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+                for shard_blocks, shard in zip(shards,
+                                               executor.map(simulate_shard, repeat(self), shards)):
+                    for (_, _, num_users), columns in zip(shard_blocks, shard):
+                        self.report_progress(num_users * self.duration)
+                        yield columns
+        else:
+            for block in blocks:
+                yield self.simulate_block(*block)
+
+    def report_progress(self, student_days: int):
+        self.simulated_days += student_days
+        if self.progress is not None:
+            self.progress(self.simulated_days, sum(size for _, size in self.cohort_sizes())
+                          * self.duration)
+
+    def flush(self, final: bool = False):
+        if self.sink is not None:
+            while (len(self.events) - self.flushed >= self.chunk_size or
+                   final and len(self.events) > self.flushed):
+                stop = min(self.flushed + self.chunk_size, len(self.events))
+                with self.instrumentation.phase("write_output", events=stop - self.flushed):
+                    self.sink.write(self.events.to_frame(details=True, start=self.flushed,
+                                                         stop=stop))
+                self.flushed = stop
+        if not self.keep_events:
+            self.events.drop_front(self.flushed if self.sink is not None else len(self.events))
+            self.flushed = 0
+
+    def cohort_sizes(self) -> list[tuple[int, int]]:
+        return [(level, int(self.num_users * share)) for level, share in ENGAGEMENT_SHARES.items()]
+
+    def blocks(self) -> list[tuple[int, int, int]]:
+        # (engagement level, first user, number of users) for every `block_size` slice of a cohort
+        blocks = []
+        first_user = 0
+        for level, num_users in self.cohort_sizes():
+            for block_start in range(0, num_users, self.block_size):
+                blocks.append((level,
+                               first_user + block_start,
+                               min(self.block_size, num_users - block_start)))
+            first_user += num_users
+        return blocks
+
+    def simulate_block(self, level: int, first_user: int, num_users: int) -> dict[str, np.ndarray]:
+        start = int(pd.Timestamp(self.start_date).timestamp())
+
+        if self.backend == "numpy":
+            # draws the whole block as batched arrays instead of stepping every Student
+            with self.instrumentation.phase("simulate_cohort"):
+                columns = simulate_cohort(np.random.default_rng([self.seed, first_user]),
+                                          ENGAGEMENT_PARAMETERS[level],
+                                          num_users,
+                                          self.duration,
+                                          np.array([len(room.objects) for room in self.rooms]),
+                                          start,
+                                          self.login_model,
+                                          self.transition_weights)
+            self.instrumentation.count("simulate_cohort", len(columns["user"]))
+            columns["user"] += first_user
+            self.report_progress(num_users * self.duration)
+            return columns
+
+        events = EventBuffer(self.events.room_names, self.events.object_names)
+        users, schedule = self.create_students(level, first_user, num_users, events)
+
+        with self.instrumentation.phase("day_loop"):
+            for day in range(self.duration):
+                self.simulate_day(users, schedule, day, start)
+                self.report_progress(num_users)
+        self.instrumentation.count("day_loop", len(events))
+
+        # students log day by day, keep one contiguous log per student
+        events.sort_by_user()
+        return events.columns()
 
-        for _ in range(num_users_low_engagement):
-            new_user = Student(f"{fake.first_name()} {fake.last_name()}", 1)
-            new_user.calculate_login_days(self.start_date, self.duration)
-            self.users.append(new_user)
+    def create_students(self,
+                        level: int,
+                        first_user: int,
+                        num_users: int,
+                        events: EventBuffer) -> tuple[list[Student], np.ndarray]:
+        # the login days of the whole block are one draw, from the block's own seed
+        with self.instrumentation.phase("login_schedule"):
+            login_frequency = (ENGAGEMENT_PARAMETERS[level]["login_frequency"]
+                               if self.login_model == "frequency" else None)
+            schedule = draw_login_schedule(np.random.default_rng([self.seed, first_user]),
+                                           num_users,
+                                           self.duration,
+                                           login_frequency)
 
-        for _ in range(num_users_average_engagement):
-            new_user = Student(f"{fake.first_name()} {fake.last_name()}", 2)
-            new_user.calculate_login_days(self.start_date, self.duration)
-            self.users.append(new_user)
+        users = []
+        with self.instrumentation.phase("create_students"):
+            for index in range(first_user, first_user + num_users):
+                new_user = Student(self.events.names[index],
+                                   level,
+                                   index=index,
+                                   events=events,
+                                   rng=random.Random(student_seed(self.seed, index)))
+                new_user.login_days = schedule[index - first_user]
+                users.append(new_user)
+        return users, schedule
 
-        for _ in range(num_users_high_engagement):
-            new_user = Student(f"{fake.first_name()} {fake.last_name()}", 3)
-            new_user.calculate_login_days(self.start_date, self.duration)
-            self.users.append(new_user)
+    def simulate_day(self, users: list[Student], schedule: np.ndarray, day: int, start: int):
+        for i in np.flatnonzero(schedule[:, day]):
+            user = users[i]
+            user.timestamp = start + day * SECONDS_PER_DAY
+            user.move_and_interact(self.room_table)
+
+    def block_stream(self, level: int, first_user: int, num_users: int):
+        # the events of a block in timestamp order. The python backend simulates the block a
+        # day at a time and only keeps that day's events; the numpy backend draws the whole
+        # block at once
+        if self.backend == "numpy":
+            yield from time_ordered(self.simulate_block(level, first_user, num_users))
+            return
+
+        start = int(pd.Timestamp(self.start_date).timestamp())
+        events = EventBuffer(self.events.room_names, self.events.object_names)
+        users, schedule = self.create_students(level, first_user, num_users, events)
+        for day in range(self.duration):
+            self.simulate_day(users, schedule, day, start)
+            self.report_progress(num_users)
+            yield from time_ordered(events.columns())
+            events.drop_front(len(events))
+
+    def iter_events(self, speed: float = None, progress=None):
+        """Yields the events of the simulation one by one, in timestamp order over all students.
+
+        Every block of students is a stream sorted by timestamp, and the streams are merged
+        with a heap as they are consumed, so the python backend holds the students and one day
+        of events per block rather than the whole log. The numpy backend holds the arrays of
+        every block, since each one is drawn at once. The events are the same as the rows of
+        run_simulation's log, as dicts with its columns; they are neither kept nor written, and
+        the blocks run in this process whatever the number of workers.
+
+        With a speed, events are yielded no faster than speed times real time, e.g. 3600 plays
+        an hour of simulated time per second. progress is called as in run_simulation.
+        """
+        clock = ReplayClock(speed) if speed is not None else None
+        self.progress = progress
+        self.simulated_days = 0
+        if self.events is None:
+            self.create_rooms_and_objects()
+            self.create_users()
+        streams = [self.block_stream(*block) for block in self.blocks()]
+        for timestamp, user, *values in heapq.merge(*streams):
+            event = self.events.event(user, timestamp, *values)
+            if clock is not None:
+                time.sleep(clock.delay(event["timestamp"]))
+            yield event
+
+    async def aiter_events(self, speed: float = None, progress=None, batch_size: int = 1_000):
+        """Async version of iter_events, e.g. to feed a queue or a websocket.
+
+        The simulation runs in a worker thread, batch_size events at a time, so the event loop
+        keeps running while blocks are simulated, and replay waits with asyncio.sleep.
+        """
+        clock = ReplayClock(speed) if speed is not None else None
+        events = self.iter_events(progress=progress)
+        while batch := await asyncio.to_thread(list, islice(events, batch_size)):
+            for event in batch:
+                if clock is not None:
+                    await asyncio.sleep(clock.delay(event["timestamp"]))
+                yield event
+
+    def create_users(self):
+        # distinct names for all the students, drawn at once; the position of a student in
+        # the buffer is their student_id
+        with self.instrumentation.phase("create_users"):
+            cohort_sizes = self.cohort_sizes()
+            names = unique_names(sum(size for _, size in cohort_sizes),
+                                 np.random.default_rng(self.seed))
+            for level, num_users in cohort_sizes:
+                self.events.add_users(names[len(self.events.names):
+                                            len(self.events.names) + num_users], level)
 
     def create_rooms_and_objects(self):
-        for room in self.rooms_and_objects.keys():
-            room_objects = [Object(name=obj_name) for obj_name in self.rooms_and_objects[room]]
-            self.rooms.append(Room(name=room, objects=room_objects))
-            for obj in room_objects:
-                self.objects.append(obj)
+        with self.instrumentation.phase("create_rooms_and_objects"):
+            environment = self.environment
+            for room in self.rooms_and_objects.keys():
+                room_objects = [Object(name=obj_name,
+                                       index=len(self.objects) + i,
+                                       position=(tuple(environment.object_positions[room][i].tolist())
+                                                 if environment else None))
+                                for i, obj_name in enumerate(self.rooms_and_objects[room])]
+                if environment:
+                    self.rooms.append(Room(name=room,
+                                           objects=room_objects,
+                                           size=environment.room_sizes[room],
+                                           index=len(self.rooms),
+                                           position=environment.room_positions[room]))
+                else:
+                    self.rooms.append(Room(name=room, objects=room_objects, index=len(self.rooms)))
+                for obj in room_objects:
+                    self.objects.append(obj)
+            self.events = EventBuffer([room.name for room in self.rooms],
+                                      [obj.name for obj in self.objects])
+            if self.room_transitions is not None:
+                self.transition_weights = transition_matrix(self.events.room_names,
+                                                            self.room_transitions)
+            self.room_table = RoomTable(self.rooms, self.transition_weights)
 
     def collect_data(self):
-        for user in self.users:
-            self.interaction_data.extend(user.interaction_log)
+        with self.instrumentation.phase("collect_data"):
+            self.interaction_data = self.events.to_frame() if self.keep_events else None
 
-    def save_to_csv(self):
-        df = pd.DataFrame(self.interaction_data)
-        df['duration'] = df['duration'].astype(str).map(lambda x: x[7:])
+    def open_sink(self) -> EventSink:
         if not self.df_path:
             date = datetime.datetime.now().strftime("%Y_%m_%d-%H_%M_%S")
-            df_path = f"../data/simulation_data_{date}.csv"
-        df.to_csv(self.df_path, index=False)
+            self.df_path = f"../data/simulation_data_{date}.{FORMATS[self.output_format]}"
+        return EventSink(self.df_path, self.output_format, self.compression)
+
+    def save_to_csv(self):
+        with self.instrumentation.phase("save_to_csv", events=len(self.events)), \
+                self.open_sink() as sink:
+            for start in range(0, len(self.events), self.chunk_size):
+                sink.write(self.events.to_frame(details=True,
+                                                start=start,
+                                                stop=start + self.chunk_size))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import networkx as nx
+from scipy import sparse
+
+from count_edges_nodes import previous_rooms
+
+# columns InteractionMatrices uses; details is only read from logs without student_id, see
+# previous_rooms
+MATRIX_COLUMNS = ["username", "student_id", "activity_type", "room", "object", "duration",
+                  "details"]
+
+
+class InteractionMatrices:
+    """Integer-indexed sparse view of a simulation log.
+
+    `students`, `objects` and `rooms` map the row and column ids back to names.
+    `interaction_counts` and `interaction_durations` are student x object matrices and
+    `room_transitions` counts the moves from one room (row) to another (column). The room a
+    move comes from is found by student_id, or in the details of logs without it, so read
+    logs with MATRIX_COLUMNS.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        usernames = df['username'].astype('category')
+        rooms = df['room'].astype('category')
+        objects = df['object'].astype('category')
+        self.students = usernames.cat.categories
+        self.rooms = rooms.cat.categories
+        self.objects = objects.cat.categories
+
+        student_ids = usernames.cat.codes.to_numpy()
+        object_ids = objects.cat.codes.to_numpy()
+        room_ids = rooms.cat.codes.to_numpy()
+        if pd.api.types.is_timedelta64_dtype(df['duration']):
+            seconds = df['duration'].dt.total_seconds().to_numpy()
+        else:
+            seconds = df['duration'].to_numpy(dtype=np.float64)
+
+        interactions = ((df['activity_type'] == 'interaction') & df['object'].notna()).to_numpy()
+        shape = (len(self.students), len(self.objects))
+        self.interaction_counts = sparse.coo_array(
+            (np.ones(interactions.sum(), dtype=np.int64),
+             (student_ids[interactions], object_ids[interactions])),
+            shape=shape).tocsr()
+        self.interaction_durations = sparse.coo_array(
+            (seconds[interactions], (student_ids[interactions], object_ids[interactions])),
+            shape=shape).tocsr()
+
+        previous_room = pd.Categorical(previous_rooms(df), categories=self.rooms).codes
+        moves = ((df['activity_type'] == 'movement').to_numpy() & (previous_room >= 0))
+        self.room_transitions = sparse.coo_array(
+            (np.ones(moves.sum(), dtype=np.int64), (previous_room[moves], room_ids[moves])),
+            shape=(len(self.rooms), len(self.rooms))).tocsr()
+
+    def student_degrees(self) -> np.ndarray:
+        # number of distinct objects each student interacted with
+        return np.diff(self.interaction_counts.indptr)
+
+    def object_degrees(self) -> np.ndarray:
+        # number of distinct students that interacted with each object
+        return np.bincount(self.interaction_counts.indices, minlength=len(self.objects))
+
+    def student_object_graph(self) -> nx.DiGraph:
+        G = nx.DiGraph()
+        G.add_nodes_from(self.students, type='Student')
+        G.add_nodes_from(self.objects, type='Object')
+        # both matrices share the same sparsity pattern, as every interaction has a duration
+        counts = self.interaction_counts.tocoo()
+        durations = self.interaction_durations.tocoo()
+        G.add_edges_from(
+            (self.students[row], self.objects[col], {'count': int(count), 'duration': duration})
+            for row, col, count, duration in zip(counts.row, counts.col, counts.data,
+                                                 durations.data))
+        return G
+
+    def room_transition_graph(self) -> nx.DiGraph:
+        G = nx.from_scipy_sparse_array(self.room_transitions,
+                                       create_using=nx.DiGraph,
+                                       edge_attribute='count')
+        return nx.relabel_nodes(G, dict(enumerate(self.rooms)))
@@ -1,32 +1,90 @@
+import numpy as np
 import pandas as pd
 
+from instrumentation import Instrumentation
+from loader import read_simulation_log, METRICS_COLUMNS
+
+DEFAULT_WEIGHTS = {'time': 0.25, 'frequency': 0.25, 'diversity': 0.25, 'depth': 0.25}
+
+METRIC_COLUMNS = ["username", "Total Interaction Time", "Interaction Frequency",
+                  "Interaction Diversity", "Interaction Depth", "Engagement Score",
+                  "Engagement Level"]
+
+
+def derive_metrics(user_metrics: pd.DataFrame,
+                   weights: dict[str, float],
+                   total_possible_interactions: int) -> pd.DataFrame:
+    # turns the per-user sums (time, frequency and number of distinct objects) into the
+    # final metrics, column-wise
+    if total_possible_interactions > 0:
+        user_metrics["Interaction Diversity"] /= total_possible_interactions
+    else:
+        user_metrics["Interaction Diversity"] = 0
+    frequency = user_metrics["Interaction Frequency"]
+    user_metrics["Interaction Depth"] = (
+        user_metrics["Total Interaction Time"] / frequency.where(frequency > 0)).fillna(0)
+    user_metrics["Engagement Score"] = (
+        weights['time'] * user_metrics["Total Interaction Time"] +
+        weights['frequency'] * frequency +
+        weights['diversity'] * user_metrics["Interaction Diversity"] +
+        weights['depth'] * user_metrics["Interaction Depth"])
+    return user_metrics[METRIC_COLUMNS]
+
 
 class Metrics:
     def __init__(self,
                  data: pd.DataFrame,
                  weights: dict[str, float] = None,
-                 total_objects: list[str] = None):
+                 total_objects: list[str] = None,
+                 instrumentation: Instrumentation = None):
+        self.instrumentation = instrumentation or Instrumentation(enabled=False)
         self.data = data
-        self.data['timestamp'] = pd.to_datetime(self.data['timestamp'])
-        self.data['duration'] = pd.to_timedelta(self.data['duration'])
+        with self.instrumentation.phase("convert_types", events=len(self.data)):
+            if 'timestamp' in self.data:
+                self.data['timestamp'] = pd.to_datetime(self.data['timestamp'])
+            if pd.api.types.is_numeric_dtype(self.data['duration']):
+                # durations in seconds, as returned by read_simulation_log
+                self.data['duration'] = pd.to_timedelta(self.data['duration'], unit='s')
+            else:
+                self.data['duration'] = pd.to_timedelta(self.data['duration'])
         if weights is None:
-            weights = {'time': 0.25, 'frequency': 0.25, 'diversity': 0.25, 'depth': 0.25}
+            weights = DEFAULT_WEIGHTS
         self.weights = weights
         self.total_objects = total_objects
 
     def calculate_per_user(self):
-        user_metrics = []
-        for username, group in self.data.groupby('username'):
-            user_metrics.append({
-                "username": username,
-                "Total Interaction Time": self.total_interaction_time(group),
-                "Interaction Frequency": self.interaction_frequency(group),
-                "Interaction Diversity": self.interaction_diversity(group),
-                "Interaction Depth": self.interaction_depth(group),
-                "Engagement Score": self.engagement_score(group),
-                "Engagement Level": group['engagement_level'].iloc[0]
-            })
-        return pd.DataFrame(user_metrics)
+        with self.instrumentation.phase("calculate_per_user", events=len(self.data)):
+            return self.per_user_metrics()
+
+    def per_user_metrics(self):
+        # one groupby pass for all the metrics, the derived ones are computed column-wise
+        is_interaction = self.data['activity_type'] == 'interaction'
+        data = self.data.assign(
+            seconds=self.data['duration'].dt.total_seconds(),
+            is_interaction=is_interaction,
+            interacted_object=self.data['object'].where(is_interaction))
+        aggregations = {
+            "Total Interaction Time": ("seconds", "sum"),
+            "Interaction Frequency": ("is_interaction", "sum"),
+            "Interaction Diversity": ("interacted_object", "nunique"),
+            "Engagement Level": ("engagement_level", "first"),
+        }
+        if 'student_id' in data:
+            # one row per student even if two students share a name; logs without ids are
+            # grouped by name
+            user_metrics = data.groupby('student_id', sort=True).agg(
+                username=('username', 'first'), **aggregations).reset_index(drop=True)
+        else:
+            user_metrics = data.groupby('username', sort=True, observed=True).agg(
+                **aggregations).reset_index()
+        if isinstance(user_metrics['username'].dtype, pd.CategoricalDtype):
+            # categories are in the order the simulation created the users, the rows are
+            # sorted by name as for a plain string column
+            user_metrics['username'] = user_metrics['username'].astype(
+                user_metrics['username'].cat.categories.dtype)
+        user_metrics = user_metrics.sort_values('username', kind='stable', ignore_index=True)
+
+        return derive_metrics(user_metrics, self.weights, len(self.total_objects))
 
     @staticmethod
     def total_interaction_time(user_data):
@@ -65,23 +123,93 @@ class Metrics:
         return dataframe
 
 
-def run_metrics(
-        simulation_df_name: str,
-        rooms_and_objects: dict[str, list[str]],
-        weights=None,
-) -> pd.DataFrame:
+class MetricsAccumulator:
+    """Running per-user sums that the simulation updates as events are generated.
 
-    if weights is None:
-        weights = {'time': 0.25, 'frequency': 0.25, 'diversity': 0.25, 'depth': 0.25}
+    Keeps the total duration, the number of interactions and a bitmask of the objects each
+    user interacted with, so the metrics are available without the raw event log.
+    """
 
-    interaction_df = pd.read_csv(f'../data/{simulation_df_name}.csv')
+    def __init__(self,
+                 names: list[str],
+                 engagement_levels: list[int],
+                 object_names: list[str]):
+        self.names = names
+        self.engagement_levels = engagement_levels
+        # objects that share a name count once for the diversity, as in Metrics
+        distinct_objects, self.object_codes = np.unique(np.array(object_names, dtype=object),
+                                                        return_inverse=True)
+        self.num_objects = len(object_names)
+        self.total_seconds = np.zeros(len(names), dtype=np.int64)
+        self.num_events = np.zeros(len(names), dtype=np.int64)
+        self.num_interactions = np.zeros(len(names), dtype=np.int64)
+        self.objects_seen = np.zeros((len(names), -(-len(distinct_objects) // 8)),
+                                     dtype=np.uint8)
+
+    def update(self, columns: dict[str, np.ndarray]):
+        user = columns["user"]
+        num_users = len(self.names)
+        self.total_seconds += np.bincount(user, weights=columns["duration"],
+                                          minlength=num_users).astype(np.int64)
+        self.num_events += np.bincount(user, minlength=num_users)
+
+        is_interaction = columns["object"] >= 0
+        interacting_user = user[is_interaction]
+        self.num_interactions += np.bincount(interacting_user, minlength=num_users)
+        obj = self.object_codes[columns["object"][is_interaction]]
+        np.bitwise_or.at(self.objects_seen,
+                         (interacting_user, obj >> 3),
+                         (1 << (obj & 7)).astype(np.uint8))
+
+    def to_frame(self, weights: dict[str, float] = None) -> pd.DataFrame:
+        if weights is None:
+            weights = DEFAULT_WEIGHTS
+        # one row per student that has events, sorted by name like Metrics
+        active = np.flatnonzero(self.num_events)
+        user_metrics = pd.DataFrame({
+            "username": np.array(self.names, dtype=object)[active],
+            "Total Interaction Time": self.total_seconds[active].astype(np.float64),
+            "Interaction Frequency": self.num_interactions[active],
+            "Interaction Diversity": np.unpackbits(self.objects_seen[active], axis=1).sum(axis=1),
+            "Engagement Level": np.array(self.engagement_levels, dtype=np.int64)[active],
+        }).sort_values("username", kind="stable", ignore_index=True)
+        return derive_metrics(user_metrics, weights, self.num_objects)
+
+
+def calculate_metrics(interaction_df: pd.DataFrame,
+                      rooms_and_objects: dict[str, list[str]],
+                      weights=None,
+                      instrumentation: Instrumentation = None) -> pd.DataFrame:
+    # normalised metrics of an in-memory log; the columns Metrics converts are replaced on a
+    # shallow copy, so interaction_df itself is left untouched
+    if weights is None:
+        weights = DEFAULT_WEIGHTS
 
     total_objects = [obj_name for sublist in rooms_and_objects.values() for obj_name in sublist]
 
-    metrics = Metrics(data=interaction_df, weights=weights, total_objects=total_objects)
+    metrics = Metrics(data=interaction_df.copy(deep=False), weights=weights,
+                      total_objects=total_objects, instrumentation=instrumentation)
 
     results_df = metrics.calculate_per_user()
-    normalised_results = metrics.normalise(results_df)
+    with metrics.instrumentation.phase("normalise", events=len(results_df)):
+        return metrics.normalise(results_df)
+
+
+def run_metrics(
+        simulation_df_name: str,
+        rooms_and_objects: dict[str, list[str]],
+        weights=None,
+        instrumentation: Instrumentation = None,
+) -> pd.DataFrame:
+
+    instrumentation = instrumentation or Instrumentation(enabled=False)
+    with instrumentation.phase("read_simulation_log"):
+        interaction_df = read_simulation_log(f'../data/{simulation_df_name}.csv',
+                                             columns=METRICS_COLUMNS)
+    instrumentation.count("read_simulation_log", len(interaction_df))
+
+    normalised_results = calculate_metrics(interaction_df, rooms_and_objects, weights,
+                                           instrumentation)
     normalised_results.to_csv(f'../data/metrics_{simulation_df_name}.csv', index=False)
 
     return normalised_results
@@ -0,0 +1,58 @@
+import functools
+
+import numpy as np
+from faker import Faker
+
+
+@functools.lru_cache(maxsize=None)
+def name_lists(locale: str = 'pt_BR') -> tuple[np.ndarray, np.ndarray]:
+    # first and last names of the Faker person provider, read once per locale
+    provider = Faker(locale=locale).factories[0].provider("faker.providers.person")
+    first_names = np.array(sorted(set(provider.first_names)), dtype=object)
+    last_names = np.array(sorted(set(provider.last_names)), dtype=object)
+    return first_names, last_names
+
+
+def unique_names(num_names: int, rng: np.random.Generator, locale: str = 'pt_BR') -> list[str]:
+    """Draws num_names distinct "first last" names, uniformly among all the combinations.
+
+    When there are more names to draw than "first last" combinations, a second last name is
+    added ("first last last", as in Portuguese names), and past that names are reused with a
+    number appended.
+    """
+    first_names, last_names = name_lists(locale)
+    num_first, num_last = len(first_names), len(last_names)
+
+    if num_names <= num_first * num_last:
+        codes = rng.choice(num_first * num_last, size=num_names, replace=False)
+        first, last = np.divmod(codes, num_last)
+        names = first_names[first] + " " + last_names[last]
+    else:
+        capacity = num_first * num_last * num_last
+        codes = rng.choice(capacity, size=min(num_names, capacity), replace=False)
+        first, rest = np.divmod(codes, num_last * num_last)
+        middle, last = np.divmod(rest, num_last)
+        names = first_names[first] + " " + last_names[middle] + " " + last_names[last]
+        names = np.resize(names, num_names)
+    return number_duplicates(list(names))
+
+
+def number_duplicates(names: list[str]) -> list[str]:
+    # "Ana Souza", "Ana Souza" -> "Ana Souza", "Ana Souza 2"; also catches combinations that
+    # spell the same name, e.g. a compound first name followed by a last name
+    counts = {}
+    taken = set(names)
+    unique = []
+    for name in names:
+        if name not in counts:
+            counts[name] = 1
+            unique.append(name)
+            continue
+        while True:
+            counts[name] += 1
+            numbered = f"{name} {counts[name]}"
+            if numbered not in taken:
+                break
+        taken.add(numbered)
+        unique.append(numbered)
+    return unique
@@ -0,0 +1,150 @@
+import numpy as np
+
+from events import MOVEMENT, INTERACTION
+
+SECONDS_PER_DAY = 86_400
+
+
+LOGIN_MODELS = ("frequency", "half")
+
+
+def draw_login_schedule(rng: np.random.Generator,
+                        num_students: int,
+                        num_days: int,
+                        login_frequency: float = None) -> np.ndarray:
+    """Students x days boolean matrix of the days each student logs in, drawn at once.
+
+    With a login_frequency every student logs in on each day with probability
+    1 / login_frequency, e.g. about once a week for 7. Without one, every student logs in on
+    half of the days, picked without repetition.
+    """
+    if login_frequency is not None:
+        return rng.random((num_students, num_days)) < 1 / login_frequency
+    schedule = np.zeros((num_students, num_days), dtype=bool)
+    order = np.argsort(rng.random((num_students, num_days)), axis=1)
+    np.put_along_axis(schedule, order[:, :num_days // 2], True, axis=1)
+    return schedule
+
+
+def segment_starts(keys: np.ndarray) -> np.ndarray:
+    starts = np.ones(len(keys), dtype=bool)
+    starts[1:] = keys[1:] != keys[:-1]
+    return starts
+
+
+def segmented_cumsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+    # cumulative sum that restarts at every True in `starts`
+    total = np.cumsum(values)
+    offsets = (total - values)[starts]
+    return total - np.repeat(offsets, np.diff(np.append(np.flatnonzero(starts), len(values))))
+
+
+def weighted_rooms(rng: np.random.Generator,
+                   move: np.ndarray,
+                   first_step: np.ndarray,
+                   transition_weights: np.ndarray) -> np.ndarray:
+    # room of every step when moves follow a transition matrix. Each move depends on the room
+    # before it, so the k-th moves of all the students are drawn together, k = 1, 2, ...
+    num_rooms = len(transition_weights)
+    cum_weights = np.cumsum(transition_weights, axis=1)
+    cum_weights /= cum_weights[:, -1:]  # exactly 1 at the end, so every draw in [0, 1) lands
+    # only the next rooms with a positive weight, row after row and shifted by the row number,
+    # so one searchsorted draws the moves from any room and large sparse matrices stay cheap
+    from_rooms, next_rooms = np.nonzero(transition_weights)
+    keys = from_rooms + cum_weights[from_rooms, next_rooms]
+    last_key = np.searchsorted(from_rooms, np.arange(num_rooms), side='right') - 1
+    move_steps = np.flatnonzero(move)
+    first_move = first_step[move_steps]
+    rank = segmented_cumsum(np.ones(len(move_steps), dtype=np.int64), first_move) - 1
+
+    destination = np.empty(len(move_steps), dtype=np.int64)
+    destination[first_move] = rng.integers(0, num_rooms, size=int(first_move.sum()))
+    draws = rng.random(len(move_steps))
+    order = np.argsort(rank, kind='stable')
+    bounds = np.searchsorted(rank[order], np.arange(1, rank.max(initial=0) + 2))
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        # the previous move of a student is the one right before it
+        moves = order[begin:end]
+        previous = destination[moves - 1]
+        # a draw that rounds up to the next row stays in the last room of its own row
+        key = np.minimum(np.searchsorted(keys, previous + draws[moves], side='right'),
+                         last_key[previous])
+        destination[moves] = next_rooms[key]
+
+    # every step is in the room of the last move up to it
+    return destination[np.cumsum(move) - 1]
+
+
+def simulate_cohort(rng: np.random.Generator,
+                    parameters: dict,
+                    num_students: int,
+                    num_days: int,
+                    objects_per_room: np.ndarray,
+                    start: int,
+                    login_model: str = "frequency",
+                    transition_weights: np.ndarray = None) -> dict[str, np.ndarray]:
+    num_rooms = len(objects_per_room)
+    first_object = np.concatenate(([0], np.cumsum(objects_per_room)[:-1]))
+
+    num_interactions = rng.integers(*parameters["num_interactions"], size=num_students,
+                                    endpoint=True)
+    login_frequency = parameters["login_frequency"] if login_model == "frequency" else None
+    login_student, login_day = np.nonzero(
+        draw_login_schedule(rng, num_students, num_days, login_frequency))
+
+    # one step per (student, login day, interaction), in the order Student.move_and_interact
+    # would produce them
+    steps_per_login = num_interactions[login_student]
+    student = np.repeat(login_student, steps_per_login)
+    day = np.repeat(login_day, steps_per_login)
+    num_steps = len(student)
+    first_step = segment_starts(student)
+
+    move = rng.random(num_steps) > parameters["interaction_probability"]
+    move[first_step] = True
+
+    if num_rooms == 1:
+        # with a single room every move stays in it
+        room = np.zeros(num_steps, dtype=np.int64)
+    elif transition_weights is None:
+        # moving to a different room is a uniform offset in 1..num_rooms-1 from the current
+        # room, so the room sequence is a cumulative sum of offsets modulo the number of rooms
+        offset = np.where(move, rng.integers(1, num_rooms, size=num_steps), 0)
+        offset[first_step] = rng.integers(0, num_rooms, size=int(first_step.sum()))
+        room = segmented_cumsum(offset, first_step) % num_rooms
+    else:
+        room = weighted_rooms(rng, move, first_step, transition_weights)
+    previous_room = np.empty_like(room)
+    previous_room[1:] = room[:-1]
+    previous_room[first_step] = -1
+
+    has_object = objects_per_room[room] > 0
+    local_object = (rng.random(num_steps) * objects_per_room[room]).astype(np.int64)
+    obj = np.where(has_object, first_object[room] + local_object, -1)
+
+    movement_duration = rng.integers(*parameters["movement_range"], size=num_steps,
+                                     endpoint=True)
+    interaction_duration = rng.integers(*parameters["interaction_range"], size=num_steps,
+                                        endpoint=True)
+
+    # every step emits an optional movement followed by an optional interaction
+    valid = np.column_stack((move, has_object)).ravel()
+
+    def interleave(movement_values, interaction_values):
+        return np.column_stack((movement_values, interaction_values)).ravel()[valid]
+
+    event_student = np.repeat(student, 2)[valid]
+    event_day = np.repeat(day, 2)[valid]
+    duration = interleave(movement_duration, interaction_duration)
+    starts = segment_starts(event_student) | segment_starts(event_day)
+    timestamp = start + event_day * SECONDS_PER_DAY + segmented_cumsum(duration, starts)
+
+    return {
+        "user": event_student,
+        "timestamp": timestamp,
+        "activity_type": np.tile([MOVEMENT, INTERACTION], num_steps)[valid],
+        "room": np.repeat(room, 2)[valid],
+        "previous_room": np.repeat(previous_room, 2)[valid],
+        "object": interleave(np.full(num_steps, -1), obj),
+        "duration": duration,
+    }
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+FORMATS = {"csv": "csv", "parquet": "parquet", "arrow": "arrow"}
+
+
+def format_duration(seconds: np.ndarray) -> np.ndarray:
+    # "HH:MM:SS" like the str(timedelta)[7:] of the original export; durations only take a few
+    # hundred distinct values, so each one is formatted once and looked up
+    unique_seconds, inverse = np.unique(seconds, return_inverse=True)
+    hours, rest = np.divmod(unique_seconds.astype(np.int64), 3600)
+    minutes, secs = np.divmod(rest, 60)
+    formatted = np.array([f"{h:02d}:{m:02d}:{s:02d}" for h, m, s in zip(hours, minutes, secs)],
+                         dtype=object)
+    return formatted[inverse.ravel()]
+
+
+class EventSink:
+    """Writes chunks of the event log to a csv, parquet or arrow ipc file as they are produced.
+
+    `compression` is passed to the parquet writer ("snappy", "gzip", "zstd", ...) or to the
+    arrow ipc writer ("lz4" or "zstd"); csv files are written uncompressed.
+    """
+
+    def __init__(self, path: str, file_format: str = "csv", compression: str = None):
+        if file_format not in FORMATS:
+            raise ValueError(f"Unknown format '{file_format}', expected one of {tuple(FORMATS)}")
+        self.path = path
+        self.file_format = file_format
+        self.compression = compression
+        self.writer = None
+        self.num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, chunk: pd.DataFrame):
+        if self.file_format == "csv":
+            chunk = chunk.assign(
+                duration=format_duration(chunk["duration"].to_numpy().astype("timedelta64[s]")
+                                         .astype(np.int64)))
+            if self.writer is None:
+                self.writer = open(self.path, "w", newline="", encoding="utf-8")
+            chunk.to_csv(self.writer, index=False, header=self.num_rows == 0)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self.writer is None:
+                self.writer = self.open_arrow_writer(table.schema)
+            self.writer.write_table(table)
+        self.num_rows += len(chunk)
+
+    def open_arrow_writer(self, schema):
+        import pyarrow as pa
+        if self.file_format == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(self.path, schema, compression=self.compression or "snappy")
+        options = pa.ipc.IpcWriteOptions(compression=self.compression)
+        return pa.ipc.new_file(self.path, schema, options=options)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
@@ -0,0 +1,228 @@
+from collections import OrderedDict
+from itertools import islice
+import sqlite3
+
+from rdflib import BNode, Literal, URIRef
+from rdflib.store import Store, VALID_STORE, NO_STORE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT NOT NULL DEFAULT '',
+    lang TEXT NOT NULL DEFAULT '',
+    UNIQUE (kind, value, datatype, lang)
+);
+CREATE TABLE IF NOT EXISTS triples (
+    s INTEGER NOT NULL,
+    p INTEGER NOT NULL,
+    o INTEGER NOT NULL,
+    PRIMARY KEY (s, p, o)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS triples_pos ON triples (p, o, s);
+CREATE INDEX IF NOT EXISTS triples_osp ON triples (o, s, p);
+CREATE TABLE IF NOT EXISTS namespaces (
+    prefix TEXT PRIMARY KEY,
+    uri TEXT NOT NULL UNIQUE
+);
+CREATE TEMP TABLE IF NOT EXISTS pending_terms (
+    kind TEXT NOT NULL,
+    value TEXT NOT NULL,
+    datatype TEXT NOT NULL,
+    lang TEXT NOT NULL
+);
+"""
+
+# ids of the most recently used IRIs and blank nodes: the ontology terms and the students, rooms
+# and objects come back in every chunk, while nearly every literal (timestamps) is unique, so
+# literals are not kept and the cache stays the same size however long the log is
+TERM_CACHE_SIZE = 100_000
+
+# triples whose term ids are looked up and inserted together by addN
+BATCH_SIZE = 10_000
+
+
+def term_key(term) -> tuple[str, str, str, str]:
+    if isinstance(term, Literal):
+        return "L", str(term), str(term.datatype or ""), term.language or ""
+    if isinstance(term, BNode):
+        return "B", str(term), "", ""
+    return "U", str(term), "", ""
+
+
+def make_term(kind: str, value: str, datatype: str, lang: str):
+    if kind == "L":
+        return Literal(value, datatype=datatype or None, lang=lang or None)
+    if kind == "B":
+        return BNode(value)
+    return URIRef(value)
+
+
+class SQLiteStore(Store):
+    """Persistent rdflib store kept in a single SQLite file.
+
+    Terms are stored once in a `terms` table and triples as three term ids, so instances can be
+    appended across runs and queried with SPARQL without re-parsing any Turtle file.
+    """
+
+    context_aware = False
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration: str = None, identifier=None):
+        self.connection = None
+        self.term_ids = OrderedDict()
+        super().__init__(configuration, identifier)
+
+    def open(self, configuration: str, create: bool = True):
+        try:
+            self.connection = sqlite3.connect(
+                configuration if create else f"file:{configuration}?mode=rw",
+                uri=not create)
+        except sqlite3.OperationalError:
+            return NO_STORE
+        self.connection.executescript(SCHEMA)
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction: bool = True):
+        if self.connection is not None:
+            if commit_pending_transaction:
+                self.connection.commit()
+            self.connection.close()
+            self.connection = None
+            self.term_ids.clear()
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+        self.term_ids.clear()
+
+    def cached_id(self, key: tuple):
+        term_id = self.term_ids.get(key)
+        if term_id is not None:
+            self.term_ids.move_to_end(key)
+        return term_id
+
+    def cache_id(self, key: tuple, term_id: int):
+        if key[0] == "L":
+            return
+        self.term_ids[key] = term_id
+        self.term_ids.move_to_end(key)
+        if len(self.term_ids) > TERM_CACHE_SIZE:
+            self.term_ids.popitem(last=False)
+
+    def term_id(self, term, create: bool = False):
+        key = term_key(term)
+        term_id = self.cached_id(key)
+        if term_id is not None:
+            return term_id
+        row = self.connection.execute(
+            "SELECT id FROM terms WHERE kind = ? AND value = ? AND datatype = ? AND lang = ?",
+            key).fetchone()
+        if row is None:
+            if not create:
+                return None
+            row = (self.connection.execute(
+                "INSERT INTO terms (kind, value, datatype, lang) VALUES (?, ?, ?, ?)",
+                key).lastrowid,)
+        self.cache_id(key, row[0])
+        return row[0]
+
+    def term_ids_of(self, keys: set) -> dict:
+        # ids of many term keys at once, inserting the new terms, with three statements rather
+        # than one lookup per term
+        ids = {}
+        missing = []
+        for key in keys:
+            term_id = self.cached_id(key)
+            if term_id is None:
+                missing.append(key)
+            else:
+                ids[key] = term_id
+        if missing:
+            self.connection.executemany("INSERT INTO pending_terms VALUES (?, ?, ?, ?)", missing)
+            self.connection.execute(
+                "INSERT OR IGNORE INTO terms (kind, value, datatype, lang) "
+                "SELECT kind, value, datatype, lang FROM pending_terms")
+            for *key, term_id in self.connection.execute(
+                    "SELECT p.kind, p.value, p.datatype, p.lang, t.id FROM pending_terms AS p "
+                    "JOIN terms AS t USING (kind, value, datatype, lang)"):
+                ids[tuple(key)] = term_id
+                self.cache_id(tuple(key), term_id)
+            self.connection.execute("DELETE FROM pending_terms")
+        return ids
+
+    def add(self, triple, context=None, quoted=False):
+        self.connection.execute("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)",
+                                [self.term_id(term, create=True) for term in triple])
+        super().add(triple, context, quoted)
+
+    def addN(self, quads):
+        quads = iter(quads)
+        while batch := [[term_key(s), term_key(p), term_key(o)]
+                        for s, p, o, _ in islice(quads, BATCH_SIZE)]:
+            ids = self.term_ids_of({key for triple in batch for key in triple})
+            self.connection.executemany("INSERT OR IGNORE INTO triples VALUES (?, ?, ?)",
+                                        ([ids[key] for key in triple] for triple in batch))
+
+    def where(self, triple_pattern) -> tuple[str, list]:
+        conditions, parameters = [], []
+        for column, term in zip("spo", triple_pattern):
+            if term is None:
+                continue
+            conditions.append(f"t.{column} = ?")
+            parameters.append(self.term_id(term))
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), parameters
+
+    def remove(self, triple_pattern, context=None):
+        if any(term is not None and self.term_id(term) is None for term in triple_pattern):
+            return
+        where, parameters = self.where(triple_pattern)
+        self.connection.execute(f"DELETE FROM triples AS t{where}", parameters)
+
+    def triples(self, triple_pattern, context=None):
+        if any(term is not None and self.term_id(term) is None for term in triple_pattern):
+            return
+        where, parameters = self.where(triple_pattern)
+        rows = self.connection.execute(
+            "SELECT s.kind, s.value, s.datatype, s.lang, "
+            "p.kind, p.value, p.datatype, p.lang, "
+            "o.kind, o.value, o.datatype, o.lang "
+            "FROM triples AS t "
+            "JOIN terms AS s ON s.id = t.s "
+            "JOIN terms AS p ON p.id = t.p "
+            f"JOIN terms AS o ON o.id = t.o{where}",
+            parameters)
+        for row in rows:
+            yield (make_term(*row[0:4]), make_term(*row[4:8]), make_term(*row[8:12])), iter([None])
+
+    def __len__(self, context=None):
+        return self.connection.execute("SELECT COUNT(*) FROM triples").fetchone()[0]
+
+    def contexts(self, triple=None):
+        return iter([])
+
+    def bind(self, prefix, namespace, override=True):
+        if not override and self.namespace(prefix) is not None:
+            return
+        self.connection.execute("DELETE FROM namespaces WHERE prefix = ? OR uri = ?",
+                                (prefix, str(namespace)))
+        self.connection.execute("INSERT INTO namespaces VALUES (?, ?)", (prefix, str(namespace)))
+
+    def namespace(self, prefix):
+        row = self.connection.execute("SELECT uri FROM namespaces WHERE prefix = ?",
+                                      (prefix,)).fetchone()
+        return URIRef(row[0]) if row else None
+
+    def prefix(self, namespace):
+        row = self.connection.execute("SELECT prefix FROM namespaces WHERE uri = ?",
+                                      (str(namespace),)).fetchone()
+        return row[0] if row else None
+
+    def namespaces(self):
+        for prefix, uri in self.connection.execute("SELECT prefix, uri FROM namespaces").fetchall():
+            yield prefix, URIRef(uri)